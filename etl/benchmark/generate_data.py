@@ -0,0 +1,140 @@
+"""Генератор синтетических данных content.* для бенчмарка ETL.
+
+Добавляет фильмы, персоны и жанры поверх схемы из database_dump.sql.
+Число участников фильма распределено неравномерно (немного режиссеров
+и сценаристов, от нескольких до десятков актеров), а популярные персоны
+снимаются во многих фильмах, как в реальном каталоге.
+
+    python generate_data.py --films 100000 --persons 50000 --genres 40
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+import uuid
+from typing import List, Set, Tuple
+
+import psycopg
+
+ROLES = (("director", 1, 2), ("writer", 1, 3), ("actor", 3, 30))
+WORDS = (
+    "star", "war", "night", "love", "city", "dark", "return", "empire", "last",
+    "dream", "river", "ghost", "secret", "king", "storm", "journey", "code", "fire",
+)
+
+
+def connect() -> psycopg.Connection:
+    """Подключение к той же базе, что и у ETL (переменные окружения SQL_*)."""
+    return psycopg.connect(
+        host=os.environ.get("SQL_HOST", "127.0.0.1"),
+        port=os.environ.get("SQL_PORT", "5432"),
+        dbname=os.environ.get("POSTGRES_DB", "theatre"),
+        user=os.environ["POSTGRES_USER"],
+        password=os.environ["POSTGRES_PASSWORD"],
+    )
+
+
+def title(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+
+
+def popular(rng: random.Random, ids: List[uuid.UUID]) -> uuid.UUID:
+    """Выбор с перекосом к началу списка: первые персоны снимаются чаще."""
+    if rng.random() < 0.3:
+        return ids[min(int(rng.paretovariate(1.2)) - 1, len(ids) - 1)]
+    return rng.choice(ids)
+
+
+def generate(
+    conn: psycopg.Connection, films: int, persons: int, genres: int, seed: int
+) -> Tuple[int, int]:
+    """Записывает данные через COPY и возвращает число связей с персонами и жанрами."""
+    rng = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    person_ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(persons)]
+    genre_ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(genres)]
+    person_links = genre_links = 0
+
+    with conn.cursor() as cursor:
+        with cursor.copy(
+            "COPY content.genre (id, name, description, created, modified) FROM STDIN"
+        ) as copy:
+            for number, genre_id in enumerate(genre_ids):
+                copy.write_row((genre_id, f"Genre {number}", "", now, now))
+
+        with cursor.copy(
+            "COPY content.person (id, full_name, created, modified) FROM STDIN"
+        ) as copy:
+            for number, person_id in enumerate(person_ids):
+                copy.write_row((person_id, f"{title(rng)} {number}", now, now))
+
+        with cursor.copy(
+            "COPY content.film_work (id, title, description, creation_date, rating, "
+            "type, created, modified) FROM STDIN"
+        ) as film_copy:
+            film_ids = []
+            for _ in range(films):
+                film_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+                film_ids.append(film_id)
+                film_copy.write_row((
+                    film_id,
+                    title(rng),
+                    " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+                    datetime.date(rng.randint(1950, 2024), rng.randint(1, 12), 1),
+                    round(rng.uniform(1, 10), 1),
+                    rng.choice(("movie", "tv show")),
+                    now,
+                    now,
+                ))
+
+        with cursor.copy(
+            "COPY content.person_film_work (id, person_id, film_work_id, role, created) "
+            "FROM STDIN"
+        ) as copy:
+            for film_id in film_ids:
+                for role, low, high in ROLES:
+                    cast: Set[uuid.UUID] = {
+                        popular(rng, person_ids) for _ in range(rng.randint(low, high))
+                    }
+                    for person_id in cast:
+                        copy.write_row((uuid.uuid4(), person_id, film_id, role, now))
+                        person_links += 1
+
+        with cursor.copy(
+            "COPY content.genre_film_work (id, genre_id, film_work_id, created) FROM STDIN"
+        ) as copy:
+            for film_id in film_ids:
+                for genre_id in rng.sample(genre_ids, min(rng.randint(1, 3), len(genre_ids))):
+                    copy.write_row((uuid.uuid4(), genre_id, film_id, now))
+                    genre_links += 1
+
+    conn.commit()
+    return person_links, genre_links
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синтетические данные для бенчмарка ETL")
+    parser.add_argument("--films", type=int, default=10000)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--no-triggers",
+        action="store_true",
+        help="не запускать триггеры ETL при вставке (нужны права суперпользователя)",
+    )
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    with connect() as conn:
+        if args.no_triggers:
+            conn.execute("SET session_replication_role = replica")
+        person_links, genre_links = generate(
+            conn, args.films, args.persons, args.genres, args.seed
+        )
+    print(
+        f"Добавлено фильмов: {args.films}, персон: {args.persons}, жанров: {args.genres}, "
+        f"связей с персонами: {person_links}, с жанрами: {genre_links} "
+        f"за {time.monotonic() - started:.1f} с"
+    )
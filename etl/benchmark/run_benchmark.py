@@ -0,0 +1,210 @@
+"""Бенчмарк ETL: PostgresClient -> Transformer -> ElasticSearchClient.
+
+Прогоняет фильмы из локального Postgres через этапы ETL и загружает их
+в заглушку bulk API (stub_es.py, запускается автоматически).
+Печатает пропускную способность, p50/p99 времени этапов на страницу
+и пиковое потребление памяти (RSS). Результат можно сохранить (--save)
+и сравнить с базовым прогоном (--baseline).
+
+    python run_benchmark.py --films 20000 --save baseline.json
+    python run_benchmark.py --films 20000 --film-details-mode aggregated --baseline baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import stub_es
+
+STAGES = ("ids", "extract", "transform", "load")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк ETL без живого Elasticsearch")
+    parser.add_argument("--films", type=int, default=10000, help="сколько фильмов прогнать")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--film-details-mode", choices=("join", "aggregated", "columnar", "denorm"), default="join"
+    )
+    parser.add_argument("--serializer", choices=("auto", "orjson", "json"), default="auto")
+    parser.add_argument("--bulk-workers", type=int, default=1)
+    parser.add_argument("--stub-port", type=int, default=9201)
+    parser.add_argument("--stub-latency", type=float, default=0.0)
+    parser.add_argument("--stub-latency-per-doc", type=float, default=0.0)
+    parser.add_argument("--save", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="сравнить с сохраненным результатом")
+    return parser.parse_args()
+
+
+def configure(args: argparse.Namespace, state_dir: str) -> None:
+    """Настраивает ETL через переменные окружения до импорта его модулей."""
+    os.environ.update(
+        {
+            "ES_HOST": "127.0.0.1",
+            "ES_PORT": str(args.stub_port),
+            "ELASTIC_USER": os.environ.get("ELASTIC_USER", "bench"),
+            "ELASTIC_PASSWORD": os.environ.get("ELASTIC_PASSWORD", "bench"),
+            "PAGE_SIZE": str(args.page_size),
+            "CHUNK_SIZE": str(args.chunk_size),
+            "BATCH_SIZE": str(args.batch_size),
+            "FILM_DETAILS_MODE": args.film_details_mode,
+            "SERIALIZER": args.serializer,
+            "ES_BULK_WORKERS": str(args.bulk_workers),
+            "ES_BULK_ADAPTIVE": "false",
+            "ES_SKIP_UNCHANGED": "false",
+            "DOC_HASH_FILE_PATH": os.path.join(state_dir, "doc_hashes.sqlite3"),
+            "METRICS_PORT": "0",
+        }
+    )
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "postgres_to_es"))
+
+
+def percentile(values: List[float], q: int) -> float:
+    """Перцентиль q (1..99) выборки."""
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Прогоняет фильмы страницами и собирает время этапов."""
+    from config import ETL_SETTINGS
+    from ElasticSearchClient import ElasticSearchClient
+    from PostgresClient import PostgresClient
+    from StateManager import MIN_ID
+    from Transformer import Transformer
+
+    pg_client = PostgresClient()
+    es_client = ElasticSearchClient()
+    transformer = Transformer()
+    if ETL_SETTINGS.film_details_mode == "aggregated":
+        get_film_details = pg_client.get_film_details_aggregated
+        transform = transformer.stream_aggregated
+    elif ETL_SETTINGS.film_details_mode == "denorm":
+        get_film_details = pg_client.get_film_details_denorm
+        transform = transformer.stream_aggregated
+    elif ETL_SETTINGS.film_details_mode == "columnar":
+        get_film_details = pg_client.get_film_details_columns
+        transform = transformer.stream_columns
+    else:
+        get_film_details = pg_client.get_film_details
+        transform = transformer.stream
+
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    films = rows = 0
+    last_id = MIN_ID
+    started = time.perf_counter()
+    while films < args.films:
+        stage_started = time.perf_counter()
+        page = list(
+            pg_client.get_film_ids_page(last_id, min(args.page_size, args.films - films))
+        )
+        timings["ids"].append(time.perf_counter() - stage_started)
+        if not page:
+            break
+
+        stage_started = time.perf_counter()
+        details = list(get_film_details([row["id"] for row in page]))
+        timings["extract"].append(time.perf_counter() - stage_started)
+
+        stage_started = time.perf_counter()
+        documents = list(transform(details))
+        timings["transform"].append(time.perf_counter() - stage_started)
+
+        stage_started = time.perf_counter()
+        es_client.load_data(documents)
+        timings["load"].append(time.perf_counter() - stage_started)
+
+        films += len(page)
+        if args.film_details_mode == "columnar":
+            # Столбцовый режим отдает наборы столбцов, а не строки
+            rows += sum(len(columns["fw_id"]) for columns in details)
+        else:
+            rows += len(details)
+        last_id = str(page[-1]["id"])
+
+    elapsed = time.perf_counter() - started
+    pg_client.close()
+    return {
+        "settings": {
+            key: value for key, value in vars(args).items() if key not in ("save", "baseline")
+        },
+        "films": films,
+        "rows": rows,
+        "seconds": elapsed,
+        "films_per_second": films / elapsed if elapsed else 0.0,
+        "stages": {
+            stage: {
+                "total": sum(values),
+                "p50": percentile(values, 50),
+                "p99": percentile(values, 99),
+            }
+            for stage, values in timings.items()
+        },
+        # На Linux ru_maxrss в килобайтах
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    """Печатает результат и разницу с базовым прогоном."""
+
+    def delta(new: float, old: float) -> str:
+        return f" ({(new - old) / old * 100:+.1f}%)" if old else ""
+
+    base = baseline or {}
+    print(
+        f"Фильмов: {result['films']}, строк из базы: {result['rows']}, "
+        f"время: {result['seconds']:.2f} с"
+    )
+    print(
+        f"Пропускная способность: {result['films_per_second']:.1f} фильмов/с"
+        + delta(result["films_per_second"], base.get("films_per_second", 0))
+    )
+    print(
+        f"Пиковый RSS: {result['peak_rss_mb']:.1f} МБ"
+        + delta(result["peak_rss_mb"], base.get("peak_rss_mb", 0))
+    )
+    print(f"{'этап':<10}{'всего, с':>12}{'p50, мс':>12}{'p99, мс':>12}")
+    for stage, values in result["stages"].items():
+        old = base.get("stages", {}).get(stage, {})
+        print(
+            f"{stage:<10}{values['total']:>12.3f}{values['p50'] * 1000:>12.1f}"
+            f"{values['p99'] * 1000:>12.1f}"
+            + delta(values["p99"], old.get("p99", 0))
+        )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    stub = multiprocessing.Process(
+        target=stub_es.serve,
+        args=(args.stub_port, args.stub_latency, args.stub_latency_per_doc),
+        daemon=True,
+    )
+    stub.start()
+    time.sleep(0.5)
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            configure(args, state_dir)
+            result = run(args)
+    finally:
+        stub.terminate()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    report(result, baseline)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(result, file, indent=2)
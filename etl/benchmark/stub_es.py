@@ -0,0 +1,79 @@
+"""Заглушка Elasticsearch для бенчмарка ETL.
+
+Принимает bulk-запросы и отвечает успехом по каждому документу,
+не индексируя их. Задержка ответа имитирует время индексации:
+--latency секунд на запрос плюс --latency-per-doc на документ.
+
+    python stub_es.py --port 9201 --latency 0.01
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+
+class StubElasticsearchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    latency_per_doc = 0.0
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        # Клиент elasticsearch-py 8 проверяет этот заголовок у каждого ответа
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _bulk_items(self, body: bytes) -> List[Dict[str, Any]]:
+        """Ответы по документам: строка действия, затем строка документа."""
+        items = []
+        lines = [line for line in body.split(b"\n") if line]
+        for line in lines[::2]:
+            action, meta = next(iter(json.loads(line).items()))
+            items.append({action: {"_id": meta.get("_id"), "status": 200}})
+        return items
+
+    def do_HEAD(self) -> None:
+        self._reply(200, {})
+
+    def do_GET(self) -> None:
+        self._reply(200, {"version": {"number": "8.6.2"}, "tagline": "You Know, for Search"})
+
+    def do_PUT(self) -> None:
+        self._read_body()
+        self._reply(200, {"acknowledged": True})
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        if self.path.split("?")[0].endswith("/_bulk"):
+            items = self._bulk_items(body)
+            time.sleep(self.latency + self.latency_per_doc * len(items))
+            self._reply(200, {"took": 0, "errors": False, "items": items})
+        else:
+            self._reply(200, {"acknowledged": True})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve(port: int, latency: float = 0.0, latency_per_doc: float = 0.0) -> None:
+    """Запускает заглушку и обслуживает запросы до остановки процесса."""
+    StubElasticsearchHandler.latency = latency
+    StubElasticsearchHandler.latency_per_doc = latency_per_doc
+    ThreadingHTTPServer(("127.0.0.1", port), StubElasticsearchHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка bulk API Elasticsearch")
+    parser.add_argument("--port", type=int, default=9201)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-per-doc", type=float, default=0.0)
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.latency_per_doc)
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from elasticsearch import AsyncElasticsearch, exceptions
+
+from backoff import async_backoff
+from config import BACKOFF_CONFIG, ELASTIC_CONFIG, ETL_SETTINGS, INDEX_SETTINGS
+from ElasticSearchClient import ElasticSearchClient
+from logging_config import logger
+import metrics
+
+
+class AsyncElasticSearchClient(ElasticSearchClient):
+    """Асинхронный клиент Elasticsearch на AsyncElasticsearch.
+
+    Сериализация, нарезка на чанки и разбор ответов bulk API
+    общие с синхронным ElasticSearchClient. Блокирующая работа (преобразование
+    и сериализация документов, отпечатки в SQLite) выполняется в потоке
+    через asyncio.to_thread, чтобы не останавливать цикл событий.
+    Требует установленного elasticsearch[async] (aiohttp).
+    """
+
+    def _create_client(self) -> AsyncElasticsearch:
+        """Создает асинхронный клиент Elasticsearch."""
+        return AsyncElasticsearch(**self._client_params())
+
+    async def close(self) -> None:
+        """Закрывает соединения клиента."""
+        await self.es.close()
+
+    @async_backoff(**BACKOFF_CONFIG.model_dump())
+    async def create_index(self) -> None:
+        """Создает индекс в Elasticsearch."""
+        if not await self.es.indices.exists(index=ELASTIC_CONFIG.index):
+            try:
+                response = await self.es.indices.create(
+                    index=ELASTIC_CONFIG.index,
+                    body=INDEX_SETTINGS,
+                    headers={"Content-Type": "application/json"},
+                )
+                logger.info(
+                    f"Индекс '{ELASTIC_CONFIG.index}' создан успешно: {response}"
+                )
+                if self.hashes is not None:
+                    await asyncio.to_thread(self.hashes.clear, ELASTIC_CONFIG.index)
+            except exceptions.RequestError as e:
+                logger.error(f"Ошибка при создании индекса в Elasticsearch: {e}")
+                raise
+        else:
+            logger.info(f"Индекс '{ELASTIC_CONFIG.index}' уже существует.")
+            await self._update_mapping()
+
+    async def _update_mapping(self) -> None:
+        """Добавляет в существующий индекс недостающие поля и подполя маппинга."""
+        response = await self.es.indices.get_mapping(index=ELASTIC_CONFIG.index)
+        properties = INDEX_SETTINGS["mappings"]["properties"]
+        missing = self._missing_fields(response)
+        if not missing:
+            return
+        await self.es.indices.put_mapping(
+            index=ELASTIC_CONFIG.index,
+            properties={name: properties[name] for name in missing},
+        )
+        logger.warning(
+            f"В индекс '{ELASTIC_CONFIG.index}' добавлены поля {sorted(missing)}, "
+            "для их заполнения нужна полная переиндексация (--full-reindex)"
+        )
+        if self.hashes is not None:
+            await asyncio.to_thread(self.hashes.clear, ELASTIC_CONFIG.index)
+
+    async def load_data(
+        self, data: Iterable[Dict[str, Any]], index: Optional[str] = None
+    ) -> Dict[str, str]:
+        """Загружает данные в Elasticsearch чанками.
+
+        Одновременно в полете держится не больше es_bulk_workers bulk-запросов.
+        Возвращает ID документов, отклоненных ES, с причинами ошибок.
+        """
+        index = index or ELASTIC_CONFIG.index
+        fingerprints: Optional[Dict[str, bytes]] = None if self.hashes is None else {}
+        total, failed = await self._load_concurrent(
+            self._generate_chunks(data, ETL_SETTINGS.chunk_size, index, fingerprints)
+        )
+        await asyncio.to_thread(self._save_fingerprints, index, fingerprints or {}, failed)
+
+        metrics.DOCUMENTS.inc(total - len(failed), result="indexed")
+        metrics.DOCUMENTS.inc(len(failed), result="failed")
+        if not total:
+            if fingerprints is not None:
+                logger.info("Нет измененных документов для загрузки в Elasticsearch")
+            else:
+                logger.warning("Передана пустая коллекция данных в Elasticsearch!")
+            return failed
+
+        logger.info(f"Всего загружено записей: {total - len(failed)}, с ошибками: {len(failed)}")
+        return failed
+
+    async def _load_concurrent(
+        self, chunks: Iterator[List[bytes]]
+    ) -> Tuple[int, Dict[str, str]]:
+        """Отправляет чанки конкурентно с ограничением числа запросов в полете.
+
+        Очередной чанк собирается в потоке, пока отправляются предыдущие.
+        """
+        max_in_flight = max(1, ETL_SETTINGS.es_bulk_workers)
+        total = 0
+        failed: Dict[str, str] = {}
+        pending: Set[asyncio.Task] = set()
+
+        try:
+            while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                if len(pending) >= max_in_flight:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        total += self._collect_result(task.result(), failed)
+                pending.add(asyncio.create_task(self._send_chunk(chunk)))
+
+            for task in pending:
+                total += self._collect_result(await task, failed)
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+
+        return total, failed
+
+    async def _send_chunk(self, chunk: List[bytes]) -> Tuple[int, Dict[str, str]]:
+        """Отправляет чанк и возвращает количество документов в нем и ошибки."""
+        return len(chunk), await self._send_bulk(chunk)
+
+    @async_backoff(**BACKOFF_CONFIG.model_dump())
+    async def _send_bulk(self, chunk: List[bytes]) -> Dict[str, str]:
+        """Отправляет один чанк документов через bulk API."""
+        bulk_data = b"".join(chunk)
+
+        try:
+            logger.info(
+                f"Загрузка {len(chunk)} записей в индекс '{ELASTIC_CONFIG.index}'..."
+            )
+            started = time.monotonic()
+            response = await self.es.bulk(
+                body=bulk_data,
+                params={"filter_path": "items.*._id,items.*.error"},
+            )
+            latency = time.monotonic() - started
+            self.bulk_size.observe(latency)
+            metrics.BULK_SECONDS.observe(latency)
+            metrics.BULK_BYTES.inc(len(bulk_data))
+            return self._check_bulk_response(response, len(chunk))
+        except Exception as e:
+            self._on_bulk_error(e)
+            raise
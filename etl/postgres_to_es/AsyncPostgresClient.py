@@ -0,0 +1,118 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Dict, Optional, Sequence, Union
+
+import psycopg
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from backoff import async_backoff
+from config import BACKOFF_CONFIG, ETL_SETTINGS
+from logging_config import logger
+from PostgresClient import PostgresClient
+
+
+class AsyncPostgresClient(PostgresClient):
+    """Асинхронный клиент PostgreSQL на psycopg.AsyncConnection.
+
+    SQL-запросы наследуются от PostgresClient: все get_* методы
+    возвращают асинхронные генераторы записей.
+    """
+
+    def __init__(self) -> None:
+        """Инициализирует асинхронный пул соединений с PostgreSQL."""
+        super().__init__(use_pool=False)
+        self._idle: "asyncio.LifoQueue[psycopg.AsyncConnection]" = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(ETL_SETTINGS.pg_pool_size)
+
+    @async_backoff(**BACKOFF_CONFIG.model_dump())
+    async def _connect(self) -> psycopg.AsyncConnection:
+        """Открывает новое асинхронное соединение с базой данных."""
+        conn = await psycopg.AsyncConnection.connect(**self.db_config)
+        logger.info("Открыто новое асинхронное соединение с PostgreSQL")
+        return conn
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncGenerator[psycopg.AsyncConnection, None]:
+        """Выдает соединение из пула, проверяя, что оно не разорвано."""
+        async with self._slots:
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except asyncio.QueueEmpty:
+                    conn = await self._connect()
+                    break
+                if conn.closed or conn.broken:
+                    logger.warning("Соединение из пула разорвано, пересоздаем")
+                    await conn.close()
+                    conn = None
+
+            try:
+                yield conn
+            finally:
+                if not (conn.closed or conn.broken):
+                    try:
+                        await conn.rollback()
+                        self._idle.put_nowait(conn)
+                        conn = None
+                    except psycopg.Error:
+                        pass
+                if conn is not None:
+                    await conn.close()
+
+    async def close(self) -> None:
+        """Закрывает простаивающие соединения пула."""
+        while not self._idle.empty():
+            await self._idle.get_nowait().close()
+
+    @async_backoff(**BACKOFF_CONFIG.model_dump())
+    async def execute(
+        self, query: Union[str, sql.Composable], params: Optional[tuple] = None
+    ) -> None:
+        """Выполняет изменяющий запрос и фиксирует транзакцию."""
+        async with self.connection() as conn:
+            await conn.execute(query, params)
+            await conn.commit()
+
+    async def fetch_records(
+        self,
+        query: Union[str, sql.Composable],
+        params: Optional[tuple] = None,
+        batch_size: int = ETL_SETTINGS.batch_size,
+        server_side: bool = ETL_SETTINGS.pg_server_side_cursors,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Асинхронно получает записи из базы данных порциями по batch_size.
+
+        Ошибка запроса пробрасывается, повтор делает вызывающий код.
+        """
+        async with self.connection() as conn:
+            try:
+                cursor_name = f"etl_{uuid.uuid4().hex}" if server_side else ""
+                async with conn.cursor(name=cursor_name, row_factory=dict_row) as cursor:
+                    if server_side:
+                        cursor.itersize = batch_size
+                    await cursor.execute(query, params)
+
+                    while True:
+                        records = await cursor.fetchmany(batch_size)
+                        if not records:
+                            break
+                        for record in records:
+                            yield record
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении запроса: {e}")
+                raise
+
+    async def fetch_columns(
+        self, query: Union[str, sql.Composable], params: Optional[tuple] = None
+    ) -> AsyncGenerator[Dict[str, Sequence[Any]], None]:
+        """Асинхронно выполняет запрос и отдает результат одним набором столбцов."""
+        async with self.connection() as conn:
+            async with conn.cursor(binary=True) as cursor:
+                await cursor.execute(query, params)
+                names = [column.name for column in cursor.description]
+                rows = await cursor.fetchall()
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        yield dict(zip(names, columns))
@@ -0,0 +1,54 @@
+import threading
+
+from logging_config import logger
+
+
+class BulkSizeController:
+    """Адаптивный лимит размера bulk-запроса в байтах.
+
+    Лимит плавно растет, пока ES отвечает быстрее целевой задержки,
+    уменьшается при медленных ответах и резко падает при отказах 429.
+    """
+
+    def __init__(
+        self,
+        initial_bytes: int,
+        min_bytes: int,
+        max_bytes: int,
+        target_latency: float,
+        adaptive: bool = True,
+    ) -> None:
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.adaptive = adaptive
+        self._limit = max(min_bytes, min(initial_bytes, max_bytes))
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        """Текущий лимит размера bulk-запроса в байтах."""
+        return self._limit
+
+    def _set_limit(self, limit: int) -> None:
+        new_limit = max(self.min_bytes, min(int(limit), self.max_bytes))
+        if new_limit != self._limit:
+            logger.info(f"Лимит bulk-запроса изменен: {self._limit} -> {new_limit} байт")
+            self._limit = new_limit
+
+    def observe(self, latency: float) -> None:
+        """Учитывает время ответа на успешный bulk-запрос."""
+        if not self.adaptive:
+            return
+        with self._lock:
+            if latency > self.target_latency:
+                self._set_limit(self._limit * 0.75)
+            elif latency < self.target_latency / 2:
+                self._set_limit(self._limit * 1.1)
+
+    def reject(self) -> None:
+        """Учитывает отказ ES принять запрос (429 Too Many Requests)."""
+        if not self.adaptive:
+            return
+        with self._lock:
+            self._set_limit(self._limit / 2)
@@ -0,0 +1,138 @@
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Generator, List
+
+import psycopg
+from psycopg import pq
+
+from backoff import backoff
+from config import BACKOFF_CONFIG
+from logging_config import logger
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить соединение из пула за отведенное время."""
+
+
+class ConnectionPool:
+    """Пул постоянных соединений с PostgreSQL.
+
+    Соединения переиспользуются между циклами ETL, проверяются при выдаче
+    и пересоздаются (с backoff) если оказались разорваны.
+    """
+
+    def __init__(self, db_config: Dict[str, Any], size: int, timeout: float) -> None:
+        self.db_config = db_config
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[psycopg.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def _connect(self) -> psycopg.Connection:
+        """Открывает новое соединение с базой данных."""
+        conn = psycopg.connect(**self.db_config)
+        logger.info("Открыто новое соединение с PostgreSQL")
+        return conn
+
+    def _is_alive(self, conn: psycopg.Connection) -> bool:
+        """Проверяет, что соединение живое и готово к работе."""
+        if conn.closed or conn.broken:
+            return False
+        try:
+            autocommit = conn.autocommit
+            conn.autocommit = True
+            try:
+                conn.execute("")
+            finally:
+                conn.autocommit = autocommit
+        except psycopg.Error:
+            return False
+        return True
+
+    def _discard(self, conn: psycopg.Connection) -> None:
+        """Закрывает соединение и освобождает место в пуле."""
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._opened -= 1
+
+    def _acquire(self) -> psycopg.Connection:
+        """Выдает проверенное соединение из пула, при необходимости открывая новое."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._opened < self.size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    try:
+                        return self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout(
+                        f"Нет свободных соединений в пуле за {self.timeout} секунд"
+                    )
+
+            if self._is_alive(conn):
+                return conn
+
+            logger.warning("Соединение из пула разорвано, пересоздаем")
+            self._discard(conn)
+
+    def _release(self, conn: psycopg.Connection) -> None:
+        """Возвращает соединение в пул либо закрывает его, если оно испорчено."""
+        if conn.closed or conn.broken:
+            self._discard(conn)
+            return
+        try:
+            if conn.info.transaction_status != pq.TransactionStatus.IDLE:
+                conn.rollback()
+        except psycopg.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Generator[psycopg.Connection, None, None]:
+        """Контекстный менеджер для получения соединения из пула."""
+        conn = self._acquire()
+        try:
+            yield conn
+        except psycopg.OperationalError:
+            # Связь с базой потеряна: остальные простаивающие соединения,
+            # скорее всего, тоже мертвы, поэтому сбрасываем их все.
+            self._discard(conn)
+            conn = None
+            self.reset()
+            raise
+        finally:
+            if conn is not None:
+                self._release(conn)
+
+    def reset(self) -> None:
+        """Закрывает все простаивающие соединения, новые будут открыты по запросу."""
+        idle: List[psycopg.Connection] = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for conn in idle:
+            self._discard(conn)
+        if idle:
+            logger.info(f"Сброшено соединений в пуле: {len(idle)}")
+
+    def close(self) -> None:
+        """Закрывает пул."""
+        self.reset()
@@ -0,0 +1,61 @@
+import datetime
+import uuid
+from typing import Any, Dict, Iterable, List
+
+from logging_config import logger
+from StateManager import JsonFileStorage
+
+
+class DeadLetterStore:
+    """Хранилище фильмов, которые не удалось проиндексировать.
+
+    Записи хранятся в JSON-файле (с атомарной записью, как состояние ETL)
+    и повторяются в следующих циклах, не задерживая водяные знаки.
+    После max_attempts неудачных попыток фильм остается в файле
+    и больше не повторяется автоматически.
+    """
+
+    def __init__(self, file_path: str, max_attempts: int) -> None:
+        self.storage = JsonFileStorage(file_path)
+        self.max_attempts = max_attempts
+        self.entries: Dict[str, Dict[str, Any]] = self.storage.load_state()
+
+    def __contains__(self, film_id: Any) -> bool:
+        return str(film_id) in self.entries
+
+    def add(self, failed: Dict[str, str]) -> None:
+        """Добавляет фильмы с причинами ошибок или увеличивает счетчик попыток."""
+        if not failed:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        for film_id, reason in failed.items():
+            entry = self.entries.setdefault(
+                film_id, {"attempts": 0, "first_failed": now}
+            )
+            entry["attempts"] += 1
+            entry["last_failed"] = now
+            entry["reason"] = reason
+            if entry["attempts"] == self.max_attempts:
+                logger.error(
+                    f"Фильм {film_id} не проиндексирован за {self.max_attempts} попыток "
+                    f"и больше не будет повторяться: {reason}"
+                )
+        self.storage.save_state(self.entries)
+        logger.warning(f"Фильмов в очереди повторной индексации: {len(self.entries)}")
+
+    def resolve(self, film_ids: Iterable[Any]) -> None:
+        """Удаляет успешно проиндексированные фильмы из хранилища."""
+        removed = [
+            film_id for film_id in film_ids if self.entries.pop(str(film_id), None)
+        ]
+        if removed:
+            self.storage.save_state(self.entries)
+            logger.info(f"Повторно проиндексировано фильмов: {len(removed)}")
+
+    def pending(self, limit: int) -> List[uuid.UUID]:
+        """ID фильмов, которые еще нужно повторить (не больше limit)."""
+        return [
+            uuid.UUID(film_id)
+            for film_id, entry in self.entries.items()
+            if entry["attempts"] < self.max_attempts
+        ][:limit]
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List
+
+from logging_config import logger
+
+FIELD_DIGEST_SIZE = 8
+
+
+class DocumentHashStore:
+    """Локальный индекс отпечатков документов (индекс, film_id) -> хеши полей.
+
+    Отпечаток документа - склеенные blake2b-хеши сериализованных полей
+    в порядке ключей документа. По нему ETL пропускает документы,
+    не изменившиеся с последней успешной загрузки, и находит измененные поля
+    для частичного обновления. Хранится в SQLite рядом с состоянием ETL.
+    Отпечатки разделены по индексу, в который загружен документ: полная
+    переиндексация пишет в новый индекс со своими отпечатками, и они
+    заменяют отпечатки алиаса только после его переключения (promote).
+    """
+
+    def __init__(self, file_path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(file_path, check_same_thread=False)
+        # Файл делят процессы шардовых воркеров: при чужой блокировке записи ждем
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                index_name TEXT NOT NULL,
+                id TEXT NOT NULL,
+                fingerprint BLOB NOT NULL,
+                PRIMARY KEY (index_name, id)
+            )
+            """
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def field_digest(value: bytes) -> bytes:
+        """Хеш одного сериализованного поля документа."""
+        return hashlib.blake2b(value, digest_size=FIELD_DIGEST_SIZE).digest()
+
+    def get_many(self, index: str, ids: List[str]) -> Dict[str, bytes]:
+        """Возвращает сохраненные отпечатки документов индекса."""
+        result: Dict[str, bytes] = {}
+        with self._lock:
+            # Ограничение SQLite на число параметров запроса
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                result.update(
+                    self._conn.execute(
+                        "SELECT id, fingerprint FROM fingerprints "
+                        f"WHERE index_name = ? AND id IN ({placeholders})",
+                        [index, *batch],
+                    ).fetchall()
+                )
+        return result
+
+    def save_many(self, index: str, fingerprints: Dict[str, bytes]) -> None:
+        """Сохраняет отпечатки успешно проиндексированных документов."""
+        if not fingerprints:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (index_name, id, fingerprint) "
+                "VALUES (?, ?, ?)",
+                ((index, id, fingerprint) for id, fingerprint in fingerprints.items()),
+            )
+
+    def forget(self, index: str, ids: Iterable[str]) -> None:
+        """Удаляет отпечатки, чтобы документы были загружены целиком."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM fingerprints WHERE index_name = ? AND id = ?",
+                ((index, id) for id in ids),
+            )
+
+    def clear(self, index: str) -> None:
+        """Удаляет отпечатки индекса (индекс в ES создан заново)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM fingerprints WHERE index_name = ?", (index,))
+        logger.info(f"Отпечатки документов индекса '{index}' сброшены")
+
+    def clear_others(self, index: str) -> None:
+        """Удаляет отпечатки всех индексов, кроме index.
+
+        Остаются после прерванной полной переиндексации, чей индекс
+        так и не стал индексом алиаса.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM fingerprints WHERE index_name <> ?", (index,))
+
+    def promote(self, source: str, target: str) -> None:
+        """Заменяет отпечатки target отпечатками source одной транзакцией.
+
+        Вызывается после переключения алиаса target на индекс source.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM fingerprints WHERE index_name = ?", (target,))
+            self._conn.execute(
+                "UPDATE fingerprints SET index_name = ? WHERE index_name = ?", (target, source)
+            )
+        logger.info(f"Отпечатки документов индекса '{source}' перенесены на '{target}'")
+
+    def close(self) -> None:
+        """Закрывает соединение с SQLite."""
+        self._conn.close()
@@ -1,32 +1,171 @@
-import json
-from typing import List, Dict, Any, Generator
+import copy
+import datetime
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Any, Generator, Optional, Set, Tuple
 from elasticsearch import Elasticsearch, exceptions
 from backoff import backoff
+from BulkSizeController import BulkSizeController
 from config import BACKOFF_CONFIG, ELASTIC_CONFIG, ETL_SETTINGS, INDEX_SETTINGS
+from DocumentHashStore import FIELD_DIGEST_SIZE, DocumentHashStore
 from logging_config import logger
+import metrics
+from serializers import get_serializer
+
+
+class BulkRejectedError(Exception):
+    """ES отклонил часть документов из-за перегрузки (429)."""
 
 
 class ElasticSearchClient:
     def __init__(self) -> None:
         """Инициализирует клиент Elasticsearch."""
+        self.es = self._create_client()
+        self.bulk_size = BulkSizeController(
+            initial_bytes=ETL_SETTINGS.es_bulk_bytes,
+            min_bytes=ETL_SETTINGS.es_bulk_min_bytes,
+            max_bytes=ETL_SETTINGS.es_bulk_max_bytes,
+            target_latency=ETL_SETTINGS.es_bulk_target_latency,
+            adaptive=ETL_SETTINGS.es_bulk_adaptive,
+        )
+        self.dumps = get_serializer(ETL_SETTINGS.serializer)
+        self.hashes = (
+            DocumentHashStore(ETL_SETTINGS.doc_hash_file_path)
+            if ETL_SETTINGS.es_skip_unchanged
+            else None
+        )
+
+    def _create_client(self) -> Elasticsearch:
+        """Создает низкоуровневый клиент Elasticsearch."""
+        return Elasticsearch(**self._client_params())
+
+    def _client_params(self) -> Dict[str, Any]:
+        """Параметры подключения к Elasticsearch."""
         es_config = ELASTIC_CONFIG.model_dump()
-        self.es = Elasticsearch(
-            [
+        return {
+            "hosts": [
                 {
                     "host": es_config["host"],
                     "port": es_config["port"],
                     "scheme": es_config["method"],
                 }
             ],
-            http_auth=(es_config["user"], es_config["password"]),
+            "http_auth": (es_config["user"], es_config["password"]),
+        }
+
+    def _serialize(self, record: Dict[str, Any], index: bytes) -> bytes:
+        """Формирует строки bulk-запроса (действие и документ) для одной записи."""
+        action = b'{"index":{"_index":"%s","_id":"%s"}}\n' % (
+            index,
+            str(record["id"]).encode("utf-8"),
+        )
+        return action + self.dumps(record) + b"\n"
+
+    def _serialize_changed(
+        self,
+        record: Dict[str, Any],
+        index: bytes,
+        stored: Optional[bytes],
+        fingerprints: Dict[str, bytes],
+    ) -> Optional[bytes]:
+        """Формирует строки bulk-запроса, если документ изменился с прошлой загрузки.
+
+        Поля сериализуются по отдельности: по ним считается отпечаток документа,
+        а из них же собирается тело запроса без повторной сериализации.
+        Если включены частичные обновления и изменилась только часть полей,
+        отправляется действие update с этими полями.
+        """
+        doc_id = str(record["id"])
+        fields = [(self.dumps(key), self.dumps(value)) for key, value in record.items()]
+        digests = [DocumentHashStore.field_digest(value) for _, value in fields]
+        fingerprint = b"".join(digests)
+        if fingerprint == stored:
+            return None
+        fingerprints[doc_id] = fingerprint
+
+        action = b"index"
+        if ETL_SETTINGS.es_partial_updates and stored and len(stored) == len(fingerprint):
+            changed = [
+                field
+                for position, (field, digest) in enumerate(zip(fields, digests))
+                if stored[position * FIELD_DIGEST_SIZE:(position + 1) * FIELD_DIGEST_SIZE]
+                != digest
+            ]
+            if len(changed) < len(fields):
+                action, fields = b"update", changed
+
+        body = b"{" + b",".join(key + b":" + value for key, value in fields) + b"}"
+        if action == b"update":
+            body = b'{"doc":' + body + b"}"
+        return (
+            b'{"%s":{"_index":"%s","_id":"%s"}}\n' % (action, index, doc_id.encode("utf-8"))
+            + body
+            + b"\n"
         )
 
     def _generate_chunks(
-        self, data: List[Dict[str, Any]], chunk_size: int
-    ) -> Generator[List[Dict[str, Any]], None, None]:
-        """Генератор, разбивающий данные на чанки."""
-        for i in range(0, len(data), chunk_size):
-            yield data[i:i + chunk_size]
+        self,
+        data: Iterable[Dict[str, Any]],
+        chunk_size: int,
+        index: str,
+        fingerprints: Optional[Dict[str, bytes]] = None,
+    ) -> Generator[List[bytes], None, None]:
+        """Генератор, разбивающий данные (в том числе итератор) на чанки.
+
+        Чанк закрывается, как только достигнут лимит по числу документов
+        или по размеру сериализованного запроса в байтах.
+        Если передан словарь fingerprints, документы, не изменившиеся
+        с прошлой загрузки, пропускаются, а отпечатки отправленных
+        документов складываются в словарь для сохранения после ответа ES.
+        """
+        chunk: List[bytes] = []
+        chunk_bytes = 0
+        skipped = 0
+        max_bytes = self.bulk_size.limit
+        index_name = index.encode("utf-8")
+        data = iter(data)
+        while records := list(islice(data, chunk_size)):
+            stored: Dict[str, bytes] = {}
+            if fingerprints is not None:
+                stored = self.hashes.get_many(index, [str(record["id"]) for record in records])
+
+            for record in records:
+                if fingerprints is None:
+                    payload = self._serialize(record, index_name)
+                else:
+                    payload = self._serialize_changed(
+                        record, index_name, stored.get(str(record["id"])), fingerprints
+                    )
+                    if payload is None:
+                        skipped += 1
+                        continue
+                size = len(payload)
+                if chunk and (len(chunk) >= chunk_size or chunk_bytes + size > max_bytes):
+                    yield chunk
+                    chunk, chunk_bytes = [], 0
+                    max_bytes = self.bulk_size.limit
+                chunk.append(payload)
+                chunk_bytes += size
+
+        if chunk:
+            yield chunk
+        if skipped:
+            metrics.DOCUMENTS.inc(skipped, result="skipped")
+            logger.info(f"Пропущено неизмененных документов: {skipped}")
+
+    def _save_fingerprints(
+        self, index: str, fingerprints: Dict[str, bytes], failed: Dict[str, str]
+    ) -> None:
+        """Сохраняет отпечатки принятых документов и забывает отклоненные."""
+        if self.hashes is None:
+            return
+        self.hashes.save_many(
+            index, {doc_id: fp for doc_id, fp in fingerprints.items() if doc_id not in failed}
+        )
+        if failed:
+            # Повтор должен уйти полным документом, а не частичным update
+            self.hashes.forget(index, failed)
 
     @backoff(**BACKOFF_CONFIG.model_dump())
     def create_index(self) -> None:
@@ -41,61 +180,274 @@ class ElasticSearchClient:
                 logger.info(
                     f"Индекс '{ELASTIC_CONFIG.index}' создан успешно: {response}"
                 )
+                if self.hashes is not None:
+                    self.hashes.clear(ELASTIC_CONFIG.index)
             except exceptions.RequestError as e:
                 logger.error(f"Ошибка при создании индекса в Elasticsearch: {e}")
                 raise
         else:
             logger.info(f"Индекс '{ELASTIC_CONFIG.index}' уже существует.")
+            self._update_mapping()
 
-    @backoff(**BACKOFF_CONFIG.model_dump())
-    def load_data(self, data: List[Dict[str, Any]]) -> None:
-        """Загружает данные в Elasticsearch чанками."""
-        logger.info(f"Всего записей для загрузки: {len(data)}")
+    @staticmethod
+    def _missing_fields(response: Any) -> Set[str]:
+        """Поля маппинга, которых нет в индексе или у которых нет части подполей."""
+        properties = INDEX_SETTINGS["mappings"]["properties"]
+        missing = set()
+        for mapping in response.body.values():
+            current = mapping["mappings"].get("properties", {})
+            missing |= {
+                name
+                for name, field in properties.items()
+                if name not in current
+                or set(field.get("fields", {})) - set(current[name].get("fields", {}))
+            }
+        return missing
+
+    def _update_mapping(self) -> None:
+        """Добавляет в существующий индекс поля и подполя, которых нет в его маппинге.
 
-        if not data:
-            logger.warning("Передана пустая коллекция данных в Elasticsearch!")
+        Уже загруженные документы новых полей не содержат, поэтому хеши
+        документов сбрасываются: следующая загрузка документа перезапишет его целиком.
+        """
+        response = self.es.indices.get_mapping(index=ELASTIC_CONFIG.index)
+        properties = INDEX_SETTINGS["mappings"]["properties"]
+        missing = self._missing_fields(response)
+        if not missing:
             return
+        self.es.indices.put_mapping(
+            index=ELASTIC_CONFIG.index,
+            properties={name: properties[name] for name in missing},
+        )
+        logger.warning(
+            f"В индекс '{ELASTIC_CONFIG.index}' добавлены поля {sorted(missing)}, "
+            "для их заполнения нужна полная переиндексация (--full-reindex)"
+        )
+        if self.hashes is not None:
+            self.hashes.clear(ELASTIC_CONFIG.index)
 
-        for chunk in self._generate_chunks(data, ETL_SETTINGS.chunk_size):
-            bulk_data = ""
-            for record in chunk:
-                bulk_data += '{"index": {"_index": "%s", "_id": "%s"}}\n' % (
-                    ELASTIC_CONFIG.index,
-                    record["id"],
-                )
-                bulk_data += json.dumps(record) + "\n"
+    def load_data(
+        self, data: Iterable[Dict[str, Any]], index: Optional[str] = None
+    ) -> Dict[str, str]:
+        """Загружает данные в Elasticsearch чанками.
 
-            try:
-                logger.info(
-                    f"Загрузка {len(chunk)} записей в индекс '{ELASTIC_CONFIG.index}'..."
-                )
-                response = self.es.bulk(
-                    body=bulk_data,
-                    params={"filter_path": "items.*.error"},
-                )
+        Данные могут быть итератором: документы читаются по мере отправки,
+        в памяти одновременно находится не больше одного чанка.
+        По умолчанию документы пишутся в ELASTIC_CONFIG.index (индекс или алиас).
+        Отпечатки документов читаются и сохраняются для того индекса,
+        в который идет загрузка.
+        Возвращает ID документов, отклоненных ES, с причинами ошибок.
+        Если bulk-запрос не удался после всех повторов, исключение пробрасывается.
+        """
+        index = index or ELASTIC_CONFIG.index
+        fingerprints: Optional[Dict[str, bytes]] = None if self.hashes is None else {}
+        chunks = self._generate_chunks(data, ETL_SETTINGS.chunk_size, index, fingerprints)
+        if ETL_SETTINGS.es_bulk_workers > 1:
+            total, failed = self._load_parallel(chunks)
+        else:
+            total, failed = 0, {}
+            for chunk in chunks:
+                failed.update(self._send_bulk(chunk))
+                total += len(chunk)
+        self._save_fingerprints(index, fingerprints or {}, failed)
 
-                errors_found = False
-                for item in response.get("items", []):
-                    if "error" in item.get("index", {}):
-                        error = item["index"]["error"]
-                        logger.error(
-                            f"Ошибка при загрузке документа с ID {item['index']['_id']}:"
-                            f"{error['reason']}"
-                        )
-                        errors_found = True
-
-                if errors_found:
-                    logger.error("Ошибки при загрузке данных в Elasticsearch.")
-                else:
-                    logger.info(
-                        f"Успешно загружено {len(chunk)} записей в индекс '{ELASTIC_CONFIG.index}'."
-                    )
+        metrics.DOCUMENTS.inc(total - len(failed), result="indexed")
+        metrics.DOCUMENTS.inc(len(failed), result="failed")
+        if not total:
+            if fingerprints is not None:
+                logger.info("Нет измененных документов для загрузки в Elasticsearch")
+            else:
+                logger.warning("Передана пустая коллекция данных в Elasticsearch!")
+            return failed
 
-            except exceptions.RequestError as e:
-                logger.error(f"Ошибка при загрузке данных в Elasticsearch: {e}")
+        logger.info(f"Всего загружено записей: {total - len(failed)}, с ошибками: {len(failed)}")
+        return failed
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def create_versioned_index(self) -> str:
+        """Создает новый версионный индекс для полной переиндексации.
+
+        На время загрузки отключаются refresh и реплики. Отпечатки индексов
+        прерванных переиндексаций удаляются, отпечатки алиаса остаются
+        до его переключения.
+        """
+        index = f"{ELASTIC_CONFIG.index}_{datetime.datetime.now():%Y%m%d%H%M%S}"
+        body = copy.deepcopy(INDEX_SETTINGS)
+        body["settings"]["refresh_interval"] = "-1"
+        body["settings"]["number_of_replicas"] = 0
+        self.es.indices.create(
+            index=index,
+            body=body,
+            headers={"Content-Type": "application/json"},
+        )
+        logger.info(f"Создан индекс '{index}' для полной переиндексации")
+        if self.hashes is not None:
+            self.hashes.clear_others(ELASTIC_CONFIG.index)
+        return index
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def finish_reindex(self, index: str) -> None:
+        """Возвращает индексу рабочие настройки и делает refresh."""
+        self.es.indices.put_settings(
+            index=index,
+            settings={
+                "index": {
+                    "refresh_interval": INDEX_SETTINGS["settings"]["refresh_interval"],
+                    "number_of_replicas": ELASTIC_CONFIG.replicas,
+                }
+            },
+        )
+        self.es.indices.refresh(index=index)
+        logger.info(f"Настройки индекса '{index}' восстановлены, выполнен refresh")
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def swap_alias(self, index: str) -> List[str]:
+        """Атомарно переключает алиас ELASTIC_CONFIG.index на новый индекс.
+
+        Если под этим именем существует обычный индекс, он удаляется
+        в том же запросе. После переключения отпечатки документов нового
+        индекса становятся отпечатками алиаса.
+        Возвращает список индексов, снятых с алиаса.
+        """
+        alias = ELASTIC_CONFIG.index
+        actions: List[Dict[str, Any]] = [{"add": {"index": index, "alias": alias}}]
+        old_indices: List[str] = []
+
+        if self.es.indices.exists_alias(name=alias):
+            old_indices = [name for name in self.es.indices.get_alias(name=alias) if name != index]
+            actions = [
+                {"remove": {"index": name, "alias": alias}} for name in old_indices
+            ] + actions
+        elif self.es.indices.exists(index=alias):
+            actions.append({"remove_index": {"index": alias}})
+
+        self.es.indices.update_aliases(actions=actions)
+        logger.info(f"Алиас '{alias}' переключен на индекс '{index}'")
+        if self.hashes is not None:
+            self.hashes.promote(index, alias)
+        return old_indices
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def delete_indices(self, indices: List[str]) -> None:
+        """Удаляет старые индексы после переключения алиаса."""
+        for index in indices:
+            self.es.indices.delete(index=index)
+            logger.info(f"Удален старый индекс '{index}'")
+
+    def _load_parallel(self, chunks: Iterator[List[bytes]]) -> Tuple[int, Dict[str, str]]:
+        """Отправляет чанки параллельно, держа в полете ограниченное число bulk-запросов.
+
+        Чанки читаются из итератора только в текущем потоке, а в очереди
+        пула одновременно находится не больше es_bulk_workers + es_bulk_queue_size чанков.
+        """
+        max_in_flight = ETL_SETTINGS.es_bulk_workers + ETL_SETTINGS.es_bulk_queue_size
+        total = 0
+        failed: Dict[str, str] = {}
+        pending: Set[Future] = set()
+
+        with ThreadPoolExecutor(
+            max_workers=ETL_SETTINGS.es_bulk_workers, thread_name_prefix="es-bulk"
+        ) as executor:
+            try:
+                for chunk in chunks:
+                    if len(pending) >= max_in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            total += self._collect_result(future.result(), failed)
+                    pending.add(executor.submit(self._send_chunk, chunk))
+
+                for future in pending:
+                    total += self._collect_result(future.result(), failed)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
                 raise
-            except Exception as e:
+
+        return total, failed
+
+    def _collect_result(
+        self, result: Tuple[int, Dict[str, str]], failed: Dict[str, str]
+    ) -> int:
+        """Добавляет ошибки чанка к общим и возвращает количество документов в нем."""
+        count, chunk_failed = result
+        failed.update(chunk_failed)
+        return count
+
+    def _send_chunk(self, chunk: List[bytes]) -> Tuple[int, Dict[str, str]]:
+        """Отправляет чанк и возвращает количество документов в нем и ошибки."""
+        return len(chunk), self._send_bulk(chunk)
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def _send_bulk(self, chunk: List[bytes]) -> Dict[str, str]:
+        """Отправляет один чанк документов через bulk API.
+
+        Тело запроса собирается одним буфером bytes и передается клиенту
+        без повторного кодирования.
+        """
+        bulk_data = b"".join(chunk)
+
+        try:
+            logger.info(
+                f"Загрузка {len(chunk)} записей в индекс '{ELASTIC_CONFIG.index}'..."
+            )
+            started = time.monotonic()
+            response = self.es.bulk(
+                body=bulk_data,
+                params={"filter_path": "items.*._id,items.*.error"},
+            )
+            latency = time.monotonic() - started
+            self.bulk_size.observe(latency)
+            metrics.BULK_SECONDS.observe(latency)
+            metrics.BULK_BYTES.inc(len(bulk_data))
+            return self._check_bulk_response(response, len(chunk))
+        except Exception as e:
+            self._on_bulk_error(e)
+            raise
+
+    def _check_bulk_response(self, response: Dict[str, Any], count: int) -> Dict[str, str]:
+        """Разбирает ответ bulk API и логирует ошибки по отдельным документам.
+
+        Возвращает ID документов с ошибками и причины ошибок.
+        """
+        failed: Dict[str, str] = {}
+        rejected = 0
+        for item in response.get("items", []):
+            # Действие index или update
+            result = next(iter(item.values()))
+            if "error" in result:
+                error = result["error"]
+                if error.get("type") == "es_rejected_execution_exception":
+                    rejected += 1
+                    continue
                 logger.error(
-                    f"Неизвестная ошибка при загрузке данных в Elasticsearch: {e}"
+                    f"Ошибка при загрузке документа с ID {result['_id']}:"
+                    f"{error['reason']}"
                 )
-                raise
+                failed[result["_id"]] = error["reason"]
+
+        if rejected:
+            self.bulk_size.reject()
+            raise BulkRejectedError(
+                f"Elasticsearch отклонил {rejected} документов из-за перегрузки"
+            )
+
+        if failed:
+            logger.error("Ошибки при загрузке данных в Elasticsearch.")
+        else:
+            logger.info(
+                f"Успешно загружено {count} записей в индекс '{ELASTIC_CONFIG.index}'."
+            )
+        return failed
+
+    def _on_bulk_error(self, e: Exception) -> None:
+        """Логирует ошибку bulk-запроса и учитывает отказы 429."""
+        if isinstance(e, BulkRejectedError):
+            logger.warning(f"{e}, чанк будет отправлен повторно")
+        elif isinstance(e, exceptions.ApiError):
+            if e.meta.status == 429:
+                self.bulk_size.reject()
+            logger.error(f"Ошибка при загрузке данных в Elasticsearch: {e}")
+        else:
+            logger.error(
+                f"Неизвестная ошибка при загрузке данных в Elasticsearch: {e}"
+            )
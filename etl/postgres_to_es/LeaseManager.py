@@ -0,0 +1,201 @@
+import os
+import socket
+import threading
+import uuid
+from typing import Any, List, NamedTuple, Optional, Set
+
+from backoff import backoff
+from config import BACKOFF_CONFIG
+from logging_config import logger
+from PostgresClient import PostgresClient
+
+UUID_SPACE = 1 << 128
+
+
+class LeaseLostError(Exception):
+    """Аренду шарда забрал другой воркер."""
+
+
+class Shard(NamedTuple):
+    """Диапазон ID фильмов [first_id, last_id], k-я из count равных частей UUID."""
+
+    index: int
+    count: int
+
+    @property
+    def name(self) -> str:
+        """Имя шарда, используется как пространство имен состояния."""
+        return f"shard-{self.index}-of-{self.count}"
+
+    @property
+    def lower(self) -> int:
+        return self.index * UUID_SPACE // self.count
+
+    @property
+    def upper(self) -> int:
+        return (self.index + 1) * UUID_SPACE // self.count
+
+    @property
+    def first_id(self) -> str:
+        """ID, после которого начинается шард (для keyset-пагинации по id > first_id)."""
+        return str(uuid.UUID(int=max(self.lower - 1, 0)))
+
+    @property
+    def last_id(self) -> str:
+        """Последний ID шарда включительно."""
+        return str(uuid.UUID(int=self.upper - 1))
+
+
+class LeaseManager:
+    """Аренда шардов воркерами через таблицы content.etl_worker и content.etl_lease.
+
+    Воркер регистрируется в etl_worker независимо от того, держит ли он шарды,
+    и держит не больше своей доли шардов: count // число живых воркеров, и еще
+    по одному шарду первым count % число воркеров из них (по имени).
+    Регистрация и аренда продлеваются каждый раунд, а также из фонового потока
+    (heartbeat) раз в ttl / 3 секунд, чтобы долгий раунд не терял аренду.
+    Аренда умершего воркера истекает через ttl секунд, и его шарды забирают
+    остальные; новый воркер получает шарды, которые отдают воркеры сверх своей доли.
+    """
+
+    def __init__(
+        self, pg_client: PostgresClient, count: int, ttl: float, owner: Optional[str] = None
+    ) -> None:
+        self.pg_client = pg_client
+        self.count = count
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def rebalance(self) -> Set[Shard]:
+        """Продлевает аренду, отдает лишние шарды или берет свободные.
+
+        Возвращает шарды, которые воркер держит после перераспределения.
+        """
+        with self.pg_client.connection() as conn:
+            with conn.transaction():
+                conn.execute(
+                    """
+                    INSERT INTO content.etl_lease (shard)
+                    SELECT generate_series(0, %s - 1)
+                    ON CONFLICT (shard) DO NOTHING;
+                    """,
+                    (self.count,),
+                )
+                conn.execute("DELETE FROM content.etl_worker WHERE expires_at <= now();")
+                self._extend(conn)
+                workers = [
+                    row[0]
+                    for row in conn.execute("SELECT owner FROM content.etl_worker ORDER BY owner;")
+                ]
+                quotient, remainder = divmod(self.count, len(workers))
+                fair_share = quotient + (workers.index(self.owner) < remainder)
+                owned = self._owned(conn)
+
+                if len(owned) > fair_share:
+                    conn.execute(
+                        """
+                        UPDATE content.etl_lease
+                        SET owner = NULL, expires_at = NULL
+                        WHERE shard = ANY(%s);
+                        """,
+                        (owned[fair_share:],),
+                    )
+                    logger.info(f"Освобождены шарды: {owned[fair_share:]}")
+                elif len(owned) < fair_share:
+                    acquired = [
+                        row[0]
+                        for row in conn.execute(
+                            """
+                            UPDATE content.etl_lease
+                            SET owner = %s, expires_at = now() + make_interval(secs => %s)
+                            WHERE shard IN (
+                                SELECT shard
+                                FROM content.etl_lease
+                                WHERE shard < %s
+                                    AND (owner IS NULL OR expires_at <= now())
+                                ORDER BY shard
+                                LIMIT %s
+                                FOR UPDATE SKIP LOCKED
+                            )
+                            RETURNING shard;
+                            """,
+                            (self.owner, self.ttl, self.count, fair_share - len(owned)),
+                        )
+                    ]
+                    if acquired:
+                        logger.info(f"Взяты в аренду шарды: {sorted(acquired)}")
+
+                owned = self._owned(conn)
+
+        return {Shard(index, self.count) for index in owned}
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def renew(self) -> Set[Shard]:
+        """Продлевает аренду шардов воркера без перераспределения.
+
+        Возвращает шарды, которые воркер все еще держит.
+        """
+        with self.pg_client.connection() as conn:
+            with conn.transaction():
+                rows = self._extend(conn)
+        return {Shard(row[0], self.count) for row in rows}
+
+    def _extend(self, conn: Any) -> List[Any]:
+        """Продлевает регистрацию воркера и аренду его шардов, возвращает строки шардов."""
+        conn.execute(
+            """
+            INSERT INTO content.etl_worker (owner, expires_at)
+            VALUES (%s, now() + make_interval(secs => %s))
+            ON CONFLICT (owner) DO UPDATE SET expires_at = EXCLUDED.expires_at;
+            """,
+            (self.owner, self.ttl),
+        )
+        return conn.execute(
+            """
+            UPDATE content.etl_lease
+            SET expires_at = now() + make_interval(secs => %s)
+            WHERE owner = %s AND shard < %s
+            RETURNING shard;
+            """,
+            (self.ttl, self.owner, self.count),
+        ).fetchall()
+
+    def heartbeat(self, stop: threading.Event) -> None:
+        """Продлевает аренду раз в ttl / 3 секунд, пока не выставлен stop."""
+        while not stop.wait(self.ttl / 3):
+            try:
+                self.renew()
+            except Exception as e:
+                logger.error(f"Не удалось продлить аренду шардов: {e}")
+
+    def _owned(self, conn: Any) -> List[int]:
+        """Номера шардов, арендованных воркером."""
+        return [
+            row[0]
+            for row in conn.execute(
+                """
+                SELECT shard
+                FROM content.etl_lease
+                WHERE owner = %s AND shard < %s
+                ORDER BY shard;
+                """,
+                (self.owner, self.count),
+            )
+        ]
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def release(self) -> None:
+        """Отдает все шарды воркера при остановке."""
+        with self.pg_client.connection() as conn:
+            with conn.transaction():
+                conn.execute(
+                    """
+                    UPDATE content.etl_lease
+                    SET owner = NULL, expires_at = NULL
+                    WHERE owner = %s;
+                    """,
+                    (self.owner,),
+                )
+                conn.execute("DELETE FROM content.etl_worker WHERE owner = %s;", (self.owner,))
+        logger.info(f"Аренда шардов воркера {self.owner} снята")
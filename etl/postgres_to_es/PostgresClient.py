@@ -1,27 +1,174 @@
+import json
+import selectors
+import time
+import uuid
 import psycopg
-from typing import Generator, List, Dict, Any, Optional
+from typing import Generator, List, Dict, Any, Optional, Sequence, Tuple, Union
+from psycopg import sql
 from psycopg.rows import dict_row
-from contextlib import closing
+from contextlib import closing, contextmanager
 from logging_config import logger
-from config import BACKOFF_CONFIG, POSTGRES_PROD
+from config import BACKOFF_CONFIG, ETL_SETTINGS, POSTGRES_PROD
 from backoff import backoff
+from ConnectionPool import ConnectionPool
+from StateManager import MIN_ID
+
+MAX_ID = "ffffffff-ffff-ffff-ffff-ffffffffffff"
+
+# Диапазон ID фильмов (first_id, last_id]: шардовый воркер читает только свои фильмы
+ALL_FILMS = (MIN_ID, MAX_ID)
+
+# Фильмы с персонами и жанрами: по строке на каждую пару (персона, жанр)
+FILM_DETAILS_QUERY = """
+    SELECT
+        fw.id as fw_id,
+        fw.title as title,
+        fw.description as description,
+        fw.rating as rating,
+        fw.creation_date as creation_date,
+        fw.type as type,
+        fw.created,
+        fw.modified,
+        pfw.role,
+        p.id AS person_id,
+        p.full_name AS person_name,
+        g.name AS genre_name
+    FROM content.film_work fw
+    LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+    LEFT JOIN content.person p ON p.id = pfw.person_id
+    LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
+    LEFT JOIN content.genre g ON g.id = gfw.genre_id
+    WHERE fw.id = ANY(%s)
+    ORDER BY fw.id;
+"""
+
+# Граница чтения изменений: начало самой старой незавершенной транзакции базы,
+# но не позже read_lag секунд назад. Строки незавершенных транзакций получают
+# modified не раньше ее начала, поэтому за водяной знак до границы они не попадут.
+# Начало транзакций других ролей в pg_stat_activity не видно, а modified
+# сущностей Django ставит по часам приложения - оба случая покрывает read_lag.
+# Зависшая транзакция держит границу не дольше read_max_lag секунд, иначе
+# она остановила бы ETL.
+READ_HORIZON = sql.SQL(
+    """
+    SELECT greatest(
+        least(min(xact_start), clock_timestamp() - make_interval(secs => %s)),
+        clock_timestamp() - make_interval(secs => %s)
+    )
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND backend_type = 'client backend'
+    """
+)
+
+
+# Журналы изменений связующих таблиц: имя источника -> связующая таблица
+FILM_LINK_LOGS = {
+    "person_film_work_log": "person_film_work",
+    "genre_film_work_log": "genre_film_work",
+}
 
 
 class PostgresClient:
     """Клиент для взаимодействия с PostgreSQL."""
 
-    def __init__(self) -> None:
+    def __init__(self, use_pool: bool = ETL_SETTINGS.pg_use_pool) -> None:
         """Инициализирует подключение к базе данных PostgreSQL."""
         self.db_config = POSTGRES_PROD.model_dump()
+        self.pool: Optional[ConnectionPool] = None
+        if use_pool:
+            self.pool = ConnectionPool(
+                self.db_config,
+                size=ETL_SETTINGS.pg_pool_size,
+                timeout=ETL_SETTINGS.pg_pool_timeout,
+            )
+
+    @contextmanager
+    def connection(self) -> Generator[psycopg.Connection, None, None]:
+        """Выдает соединение из пула либо открывает новое на время запроса."""
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+        else:
+            with closing(psycopg.connect(**self.db_config)) as conn:
+                yield conn
+
+    def close(self) -> None:
+        """Закрывает соединения пула."""
+        if self.pool is not None:
+            self.pool.close()
 
     @backoff(**BACKOFF_CONFIG.model_dump())
+    def _connect_listener(self, channel: str) -> psycopg.Connection:
+        """Открывает отдельное соединение и подписывается на канал уведомлений."""
+        conn = psycopg.connect(**self.db_config, autocommit=True)
+        conn.execute(sql.SQL("LISTEN {channel};").format(channel=sql.Identifier(channel)))
+        logger.info(f"Подписка на канал уведомлений '{channel}'")
+        return conn
+
+    def listen_changes(
+        self, channel: str, window: float, max_batch: int, idle_timeout: float
+    ) -> Generator[Optional[List[Dict[str, Any]]], None, None]:
+        """Слушает уведомления об изменениях (LISTEN/NOTIFY) и отдает их пачками.
+
+        После первого уведомления пачка копится не дольше window секунд
+        или до max_batch уведомлений. Если за idle_timeout уведомлений не было,
+        отдается пустая пачка, чтобы вызывающий код мог выполнить сверку опросом.
+        После потери соединения отдается None: часть уведомлений могла пропасть.
+        """
+        while True:
+            conn = self._connect_listener(channel)
+            received: List[Dict[str, Any]] = []
+            conn.add_notify_handler(lambda notify: received.append(json.loads(notify.payload)))
+            selector = selectors.DefaultSelector()
+            selector.register(conn, selectors.EVENT_READ)
+            try:
+                while True:
+                    deadline = None
+                    while True:
+                        if deadline is None:
+                            timeout = idle_timeout
+                        else:
+                            timeout = max(0.0, deadline - time.monotonic())
+                        if selector.select(timeout):
+                            # Разбор входящих данных вызывает обработчики уведомлений
+                            conn.execute("SELECT 1")
+                        if received and deadline is None:
+                            deadline = time.monotonic() + window
+                        if not received or len(received) >= max_batch:
+                            break
+                        if time.monotonic() >= deadline:
+                            break
+
+                    batch = received[:]
+                    received.clear()
+                    yield batch
+            except psycopg.OperationalError as e:
+                logger.error(f"Соединение для уведомлений потеряно: {e}")
+                yield None
+            finally:
+                selector.close()
+                conn.close()
+
     def fetch_records(
-        self, query: str, params: Optional[tuple] = None, batch_size: int = 100
+        self,
+        query: Union[str, sql.Composable],
+        params: Optional[tuple] = None,
+        batch_size: int = ETL_SETTINGS.batch_size,
+        server_side: bool = ETL_SETTINGS.pg_server_side_cursors,
     ) -> Generator[Dict[str, Any], None, None]:
-        """Функция для получения записей из базы данных."""
-        with closing(psycopg.connect(**self.db_config)) as conn:
+        """Функция для получения записей из базы данных.
+
+        При server_side=True используется именованный (серверный) курсор,
+        и строки забираются из базы порциями по batch_size, а не целиком.
+        Ошибка запроса пробрасывается: генератор нельзя повторить с места
+        сбоя, поэтому повтор делает вызывающий код, выбирая страницу целиком.
+        """
+        with self.connection() as conn:
             try:
-                with conn.cursor(row_factory=dict_row) as cursor:
+                cursor_name = f"etl_{uuid.uuid4().hex}" if server_side else ""
+                with conn.cursor(name=cursor_name, row_factory=dict_row) as cursor:
+                    if server_side:
+                        cursor.itersize = batch_size
                     cursor.execute(query, params)
 
                     while True:
@@ -31,92 +178,305 @@ class PostgresClient:
                         yield from records
             except Exception as e:
                 logger.error(f"Ошибка при выполнении запроса: {e}")
+                raise
 
-    def get_updated_person_ids(
-        self, last_modified: str
+    def fetch_columns(
+        self, query: Union[str, sql.Composable], params: Optional[tuple] = None
+    ) -> Generator[Dict[str, Sequence[Any]], None, None]:
+        """Выполняет запрос и отдает результат одним набором столбцов {имя: значения}.
+
+        Строки читаются в бинарном формате и без создания словаря на каждую строку.
+        """
+        with self.connection() as conn:
+            with conn.cursor(binary=True) as cursor:
+                cursor.execute(query, params)
+                names = [column.name for column in cursor.description]
+                rows = cursor.fetchall()
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        yield dict(zip(names, columns))
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def execute(self, query: Union[str, sql.Composable], params: Optional[tuple] = None) -> None:
+        """Выполняет изменяющий запрос и фиксирует транзакцию."""
+        with self.connection() as conn:
+            conn.execute(query, params)
+            conn.commit()
+
+    def get_updated_ids(
+        self,
+        table: str,
+        last_modified: Any,
+        last_id: str,
+        limit: int,
+        id_range: Tuple[str, str] = ALL_FILMS,
     ) -> Generator[Dict[str, Any], None, None]:
-        """Получает список обновленных персон."""
-        query = """
+        """Получает страницу обновленных записей таблицы после водяного знака.
+
+        Пагинация ключевая: по паре (modified, id), поэтому страницы
+        ограничены по размеру и выборку можно продолжить с любой из них.
+        id_range ограничивает id записей диапазоном (first_id, last_id].
+        Записи читаются только до READ_HORIZON.
+        """
+        query = sql.SQL(
+            """
             SELECT id, modified
-            FROM content.person
-            WHERE modified > %s
-            ORDER BY modified;
+            FROM {table}
+            WHERE (modified, id) > (%s, %s)
+                AND id > %s AND id <= %s
+                AND modified < ({horizon})
+            ORDER BY modified, id
+            LIMIT %s;
+            """
+        ).format(table=sql.Identifier("content", table), horizon=READ_HORIZON)
+        return self.fetch_records(
+            query,
+            (
+                last_modified, last_id, *id_range,
+                ETL_SETTINGS.read_lag, ETL_SETTINGS.read_max_lag, limit,
+            ),
+        )
+
+    def get_updated_film_links(
+        self,
+        table: str,
+        last_modified: Any,
+        last_id: str,
+        limit: int,
+        film_range: Tuple[str, str] = ALL_FILMS,
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Получает страницу журнала изменений связующей таблицы (с ID фильмов).
+
+        modified строки журнала - время вставки (clock_timestamp() в UTC),
+        журнал читается только до READ_HORIZON, чтобы строка, зафиксированная
+        позже, не оказалась за водяным знаком.
+        """
+        query = sql.SQL(
+            """
+            SELECT id, modified, film_work_id
+            FROM {table}
+            WHERE (modified, id) > (%s, %s)
+                AND film_work_id > %s AND film_work_id <= %s
+                AND modified < timezone('utc', ({horizon}))
+            ORDER BY modified, id
+            LIMIT %s;
+            """
+        ).format(table=sql.Identifier("content", f"{table}_log"), horizon=READ_HORIZON)
+        return self.fetch_records(
+            query,
+            (
+                last_modified, last_id, *film_range,
+                ETL_SETTINGS.read_lag, ETL_SETTINGS.read_max_lag, limit,
+            ),
+        )
+
+    def get_updated_person_film_work_links(
+        self,
+        last_modified: Any,
+        last_id: str,
+        limit: int,
+        film_range: Tuple[str, str] = ALL_FILMS,
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Получает страницу изменений состава персон в фильмах."""
+        return self.get_updated_film_links(
+            "person_film_work", last_modified, last_id, limit, film_range
+        )
+
+    def get_updated_genre_film_work_links(
+        self,
+        last_modified: Any,
+        last_id: str,
+        limit: int,
+        film_range: Tuple[str, str] = ALL_FILMS,
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Получает страницу изменений жанров фильмов."""
+        return self.get_updated_film_links(
+            "genre_film_work", last_modified, last_id, limit, film_range
+        )
+
+    def delete_film_links_log(self, table: str, last_modified: Any, last_id: str) -> None:
+        """Удаляет из журнала связующей таблицы прочитанные записи.
+
+        Удаляются записи до водяного знака включительно и старше
+        read_lag секунд, остальные удалятся при следующей очистке.
         """
+        query = sql.SQL(
+            """
+            DELETE FROM {table}
+            WHERE (modified, id) <= (%s, %s)
+                AND modified < timezone('utc', clock_timestamp()) - make_interval(secs => %s);
+            """
+        ).format(table=sql.Identifier("content", f"{table}_log"))
+        return self.execute(query, (last_modified, last_id, ETL_SETTINGS.read_lag))
 
-        return self.fetch_records(query, (last_modified,))
+    def get_film_ids_page(
+        self, last_id: str, limit: int, max_id: str = MAX_ID
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Получает страницу ID фильмов по возрастанию id (для полной переиндексации).
+
+        max_id ограничивает выборку диапазоном шарда.
+        """
+        query = """
+            SELECT id
+            FROM content.film_work
+            WHERE id > %s AND id <= %s
+            ORDER BY id
+            LIMIT %s;
+        """
+        return self.fetch_records(query, (last_id, max_id, limit))
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def get_max_modified(self, table: str) -> Optional[Any]:
+        """Получает максимальное значение modified в таблице."""
+        query = sql.SQL("SELECT max(modified) AS modified FROM {table};").format(
+            table=sql.Identifier("content", table)
+        )
+        records = list(self.fetch_records(query, server_side=False))
+        return records[0]["modified"] if records else None
+
+    def get_oldest_transaction_age(self) -> Generator[Dict[str, Any], None, None]:
+        """Получает возраст (age, в секундах) самой старой незавершенной транзакции базы."""
+        query = """
+            SELECT coalesce(
+                extract(epoch FROM clock_timestamp() - min(xact_start)), 0
+            )::float AS age
+            FROM pg_stat_activity
+            WHERE datname = current_database() AND backend_type = 'client backend';
+        """
+        return self.fetch_records(query, server_side=False)
+
+    def get_updated_person_ids(
+        self, last_modified: Any, last_id: str, limit: int
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Получает страницу обновленных персон."""
+        return self.get_updated_ids("person", last_modified, last_id, limit)
 
     def get_film_ids_by_person_ids(
-        self, person_ids: List[str]
+        self, person_ids: List[str], film_range: Tuple[str, str] = ALL_FILMS
     ) -> Generator[Dict[str, Any], None, None]:
-        """Получает ID фильмов по списку ID персон"""
+        """Получает ID фильмов из диапазона film_range по списку ID персон"""
         query = """
-            SELECT fw.id, fw.modified
-            FROM content.film_work fw
-            LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+            SELECT DISTINCT pfw.film_work_id AS id
+            FROM content.person_film_work pfw
             WHERE pfw.person_id = ANY(%s)
-            ORDER BY fw.modified;
+                AND pfw.film_work_id > %s AND pfw.film_work_id <= %s;
         """
-        return self.fetch_records(query, (person_ids,))
+        return self.fetch_records(query, (person_ids, *film_range))
 
     def get_updated_genre_ids(
-        self, last_modified: str
+        self, last_modified: Any, last_id: str, limit: int
     ) -> Generator[Dict[str, Any], None, None]:
-        """Получает список обновленных жанров."""
-        query = """
-            SELECT id as id, modified
-            FROM content.genre
-            WHERE modified > %s
-            ORDER BY modified;
-        """
-        return self.fetch_records(query, (last_modified,))
+        """Получает страницу обновленных жанров."""
+        return self.get_updated_ids("genre", last_modified, last_id, limit)
 
     def get_film_ids_by_genre_ids(
-        self, genre_ids: List[str]
+        self, genre_ids: List[str], film_range: Tuple[str, str] = ALL_FILMS
     ) -> Generator[Dict[str, Any], None, None]:
-        """ "Получает ID фильмов по списку ID жанров"""
+        """Получает ID фильмов из диапазона film_range по списку ID жанров"""
         query = """
-            SELECT fw.id, fw.modified
-            FROM content.film_work fw
-            LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
+            SELECT DISTINCT gfw.film_work_id AS id
+            FROM content.genre_film_work gfw
             WHERE gfw.genre_id = ANY(%s)
-            ORDER BY fw.modified;
+                AND gfw.film_work_id > %s AND gfw.film_work_id <= %s;
         """
-        return self.fetch_records(query, (genre_ids,))
+        return self.fetch_records(query, (genre_ids, *film_range))
 
     def get_updated_film_ids(
-        self, last_modified: str
+        self,
+        last_modified: Any,
+        last_id: str,
+        limit: int,
+        film_range: Tuple[str, str] = ALL_FILMS,
     ) -> Generator[Dict[str, Any], None, None]:
-        """Получает список обновленных фильмов."""
-        query = """
-            SELECT id, modified
-            FROM content.film_work
-            WHERE modified > %s
-            ORDER BY modified;
-        """
-        return self.fetch_records(query, (last_modified,))
+        """Получает страницу обновленных фильмов из диапазона film_range."""
+        return self.get_updated_ids("film_work", last_modified, last_id, limit, film_range)
 
     def get_film_details(
         self, film_ids: List[str]
     ) -> Generator[Dict[str, Any], None, None]:
         """Получает подробную информацию о фильмах."""
+        return self.fetch_records(FILM_DETAILS_QUERY, (film_ids,))
+
+    def get_film_details_columns(
+        self, film_ids: List[str]
+    ) -> Generator[Dict[str, Sequence[Any]], None, None]:
+        """Получает подробную информацию о фильмах по столбцам.
+
+        Тот же запрос, что и в get_film_details, но строки не превращаются
+        в словари: результат отдается одним набором столбцов.
+        """
+        return self.fetch_columns(FILM_DETAILS_QUERY, (film_ids,))
+
+    def get_film_details_aggregated(
+        self, film_ids: List[str]
+    ) -> Generator[Dict[str, Any], None, None]:
+        """Получает подробную информацию о фильмах, по одной строке на фильм.
+
+        Жанры и персоны по ролям агрегируются на стороне базы,
+        поэтому строки не размножаются произведением персон на жанры.
+        Порядок как у Transformer: жанры побайтно (COLLATE "C"), персоны по id
+        (пары фильм-жанр и фильм-персона-роль уникальны), поэтому документ
+        побайтно совпадает с документом режима join.
+        """
         query = """
             SELECT
-                fw.id as fw_id,
-                fw.title as title,
-                fw.description as description,
-                fw.rating as rating,
-                fw.type as genres,
-                fw.created,
-                fw.modified,
-                pfw.role,
-                p.id AS person_id,
-                p.full_name AS person_name,
-                g.name AS genre_name
+                fw.id AS fw_id,
+                fw.title AS title,
+                fw.description AS description,
+                fw.rating AS rating,
+                fw.creation_date AS creation_date,
+                fw.type AS type,
+                COALESCE(g.genres, '{}') AS genres,
+                COALESCE(p.directors, '[]') AS directors,
+                COALESCE(p.actors, '[]') AS actors,
+                COALESCE(p.writers, '[]') AS writers
             FROM content.film_work fw
-            LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
-            LEFT JOIN content.person p ON p.id = pfw.person_id
-            LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
-            LEFT JOIN content.genre g ON g.id = gfw.genre_id
-            WHERE fw.id = ANY(%s);
+            LEFT JOIN LATERAL (
+                SELECT array_agg(g.name ORDER BY g.name COLLATE "C") AS genres
+                FROM content.genre_film_work gfw
+                JOIN content.genre g ON g.id = gfw.genre_id
+                WHERE gfw.film_work_id = fw.id
+            ) g ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT
+                    jsonb_agg(
+                        jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id
+                    ) FILTER (WHERE pfw.role = 'director') AS directors,
+                    jsonb_agg(
+                        jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id
+                    ) FILTER (WHERE pfw.role = 'actor') AS actors,
+                    jsonb_agg(
+                        jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id
+                    ) FILTER (WHERE pfw.role = 'writer') AS writers
+                FROM content.person_film_work pfw
+                JOIN content.person p ON p.id = pfw.person_id
+                WHERE pfw.film_work_id = fw.id
+            ) p ON TRUE
+            WHERE fw.id = ANY(%s)
+            ORDER BY fw.id;
+        """
+        return self.fetch_records(query, (film_ids,))
+
+    def get_film_details_denorm(self, film_ids: List[str]) -> Generator[Dict[str, Any], None, None]:
+        """Получает фильмы из content.film_work_denorm, по одной строке на фильм.
+
+        Таблицу поддерживают триггеры Django-приложения (миграция 0009),
+        поэтому выборка - поиск по первичному ключу без соединений.
+        Строки в том же виде, что и у get_film_details_aggregated.
+        """
+        query = """
+            SELECT
+                id AS fw_id,
+                title,
+                description,
+                rating,
+                creation_date,
+                type,
+                genres,
+                directors_people AS directors,
+                actors_people AS actors,
+                writers_people AS writers
+            FROM content.film_work_denorm
+            WHERE id = ANY(%s)
+            ORDER BY id;
         """
         return self.fetch_records(query, (film_ids,))
@@ -1,9 +1,21 @@
+import datetime
 import json
 import abc
 import os
-from typing import Any, Dict, List, Optional
+import tempfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from psycopg.types.json import Jsonb
+from backoff import backoff
+from config import BACKOFF_CONFIG, ETL_SETTINGS, POSTGRES_PROD
+from ConnectionPool import ConnectionPool
 from logging_config import logger
 
+MIN_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class StateCorruptedError(Exception):
+    """Файл состояния поврежден и не может быть прочитан."""
+
 
 class BaseStorage(abc.ABC):
     """Абстрактное хранилище состояния."""
@@ -16,6 +28,23 @@ class BaseStorage(abc.ABC):
     def load_state(self) -> Dict[str, Any]:
         """Получить состояние из хранилища."""
 
+    def update_state(self, expected: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Сохранить изменения ключей, значения которых в хранилище равны expected.
+
+        Ключ, который с тех пор изменил другой процесс (например, откат
+        водяных знаков полной переиндексацией), не перезаписывается.
+        Возвращает состояние хранилища после записи.
+        """
+        state = self.load_state()
+        state.update(
+            {key: value for key, value in changes.items() if state.get(key) == expected.get(key)}
+        )
+        self.save_state(state)
+        return state
+
+    def close(self) -> None:
+        """Освободить ресурсы хранилища."""
+
 
 class JsonFileStorage(BaseStorage):
     """Реализация хранилища, использующего локальный файл.
@@ -26,13 +55,36 @@ class JsonFileStorage(BaseStorage):
         self.file_path = file_path
 
     def save_state(self, state: Dict[str, Any]) -> None:
-        """Сохранить состояние в хранилище."""
+        """Сохранить состояние в хранилище.
+
+        Запись атомарная: состояние пишется во временный файл рядом,
+        сбрасывается на диск (fsync) и подменяет старый файл через rename.
+        """
+        directory = os.path.dirname(os.path.abspath(self.file_path))
         try:
-            with open(self.file_path, "w") as file:
-                json.dump(state, file)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".state-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as file:
+                    json.dump(state, file)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, self.file_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._fsync_directory(directory)
         except (OSError, IOError) as e:
             logger.error(f"Ошибка при сохранении состояния: {e}")
 
+    def _fsync_directory(self, directory: str) -> None:
+        """Сбрасывает на диск запись каталога, чтобы rename пережил сбой питания."""
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
     def load_state(self) -> Dict[str, Any]:
         """Получить состояние из хранилища."""
         if os.path.exists(self.file_path):
@@ -41,11 +93,120 @@ class JsonFileStorage(BaseStorage):
                 try:
                     data = json.load(file)
                     return data if isinstance(data, dict) else {}
-                except json.JSONDecodeError:
-                    return {}
+                except json.JSONDecodeError as e:
+                    # Пустое состояние означало бы полную перезагрузку индекса,
+                    # поэтому поврежденный файл требует вмешательства.
+                    logger.error(f"Файл состояния {self.file_path} поврежден: {e}")
+                    raise StateCorruptedError(self.file_path) from e
         return {}
 
 
+class PostgresStorage(BaseStorage):
+    """Хранилище состояния в таблице content.etl_state.
+
+    Каждый ключ состояния хранится отдельной строкой,
+    все ключи сохраняются одной транзакцией.
+    Состояния шардов разделены по namespace.
+    """
+
+    def __init__(self, pool: ConnectionPool, namespace: str = "") -> None:
+        self.pool = pool
+        self.namespace = namespace
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище."""
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor() as cursor:
+                    cursor.executemany(
+                        """
+                        INSERT INTO content.etl_state (namespace, key, value, modified)
+                        VALUES (%s, %s, %s, now())
+                        ON CONFLICT (namespace, key) DO UPDATE
+                        SET value = EXCLUDED.value, modified = EXCLUDED.modified;
+                        """,
+                        [
+                            (self.namespace, key, Jsonb(value))
+                            for key, value in state.items()
+                        ],
+                    )
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def update_state(self, expected: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Сохранить изменения ключей, значения которых в хранилище равны expected.
+
+        Строки namespace блокируются на время проверки и записи.
+        """
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                state = {
+                    key: value
+                    for key, value in conn.execute(
+                        """
+                        SELECT key, value FROM content.etl_state
+                        WHERE namespace = %s
+                        FOR UPDATE;
+                        """,
+                        (self.namespace,),
+                    )
+                }
+                changes = {
+                    key: value
+                    for key, value in changes.items()
+                    if state.get(key) == expected.get(key)
+                }
+                with conn.cursor() as cursor:
+                    cursor.executemany(
+                        """
+                        INSERT INTO content.etl_state (namespace, key, value, modified)
+                        VALUES (%s, %s, %s, now())
+                        ON CONFLICT (namespace, key) DO UPDATE
+                        SET value = EXCLUDED.value, modified = EXCLUDED.modified;
+                        """,
+                        [(self.namespace, key, Jsonb(value)) for key, value in changes.items()],
+                    )
+        return {**state, **changes}
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def load_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища."""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT key, value FROM content.etl_state WHERE namespace = %s;",
+                (self.namespace,),
+            ).fetchall()
+        logger.info("Загрузка состояния из content.etl_state")
+        return {key: value for key, value in rows}
+
+    def close(self) -> None:
+        """Закрывает пул соединений хранилища."""
+        self.pool.close()
+
+
+def namespaced_path(file_path: str, namespace: Optional[str]) -> str:
+    """Путь к файлу состояния шарда: state/state.json -> state/state.<namespace>.json."""
+    if not namespace:
+        return file_path
+    root, ext = os.path.splitext(file_path)
+    return f"{root}.{namespace}{ext}"
+
+
+def create_storage(namespace: Optional[str] = None) -> BaseStorage:
+    """Создает хранилище состояния, выбранное в ETL_SETTINGS.state_storage.
+
+    namespace отделяет состояние шарда от общего состояния ETL.
+    """
+    if ETL_SETTINGS.state_storage == "postgres":
+        return PostgresStorage(
+            ConnectionPool(
+                POSTGRES_PROD.model_dump(), size=1, timeout=ETL_SETTINGS.pg_pool_timeout
+            ),
+            namespace=namespace or "",
+        )
+    return JsonFileStorage(namespaced_path(ETL_SETTINGS.state_file_path, namespace))
+
+
 class StateManager:
     """Класс для работы с состояниями."""
 
@@ -58,28 +219,88 @@ class StateManager:
         """Добавить слушателя изменений состояния"""
         self.listeners.append(listener)
 
-    def notify(self, ids, table) -> None:
+    def notify(self, film_ids: List[Any]) -> None:
         """Уведомить слушателей об изменениях"""
-        if not ids:
-            logger.info(f"Нет обновлений в таблице {table}, пропускаем загрузку в Elasticsearch")
+        if not film_ids:
+            logger.info("Нет затронутых фильмов, пропускаем загрузку в Elasticsearch")
             return
         for listener in self.listeners:
-            listener(ids, table)
+            listener(film_ids)
 
     def change_state(
-        self, time: Any, table_data: List[Dict[str, Any]], table: str
+        self,
+        watermarks: Dict[str, Tuple[datetime.datetime, str]],
+        film_ids: List[Any],
+        before_save: Optional[Callable[[], None]] = None,
     ) -> None:
-        """Обновить состояние и уведомить слушателей об изменениях"""
-        if self.state is None:
-            self.state = {}
-
-        self.state[table] = time.isoformat()
-        self.storage.save_state(self.state)
-        ids = [id["id"] for id in table_data]
-        logger.info(f"Количество обновленных записей: {len(ids)}")
-        self.notify(ids, table)
-
-    def get_state(self, table: str) -> Optional[str]:
-        """Получить последнее сохраненное состояние для таблицы"""
-        state = self.storage.load_state()
-        return state.get(table)
+        """Уведомить слушателей о затронутых фильмах и сдвинуть водяные знаки таблиц.
+
+        Водяные знаки (modified, id) сохраняются только после того,
+        как слушатели успешно обработали фильмы. before_save вызывается
+        перед сохранением и может его отменить исключением.
+        """
+        logger.info(f"Количество фильмов для загрузки: {len(film_ids)}")
+        self.notify(film_ids)
+        if before_save is not None:
+            before_save()
+        self.save_watermarks(watermarks)
+
+    def save_watermark(self, watermark: Tuple[datetime.datetime, str], table: str) -> None:
+        """Сохранить водяной знак (modified, id) для таблицы."""
+        self.save_watermarks({table: watermark})
+
+    def save_watermarks(self, watermarks: Dict[str, Tuple[datetime.datetime, str]]) -> bool:
+        """Сохранить водяные знаки нескольких таблиц одной записью в хранилище.
+
+        Водяной знак сохраняется, только если в хранилище он не менялся
+        с последнего чтения или записи этим StateManager. Иначе (полная
+        переиндексация откатила его, пока процесс работал) принимается
+        значение из хранилища, и изменения после него обрабатываются заново.
+        Возвращает True, если сохранены все водяные знаки.
+        """
+        changes = {
+            table: {"modified": modified.isoformat(), "id": str(last_id)}
+            for table, (modified, last_id) in watermarks.items()
+        }
+        self.state = self.storage.update_state(self.state or {}, changes)
+        conflicts = [table for table, value in changes.items() if self.state.get(table) != value]
+        for table in conflicts:
+            logger.warning(
+                f"Водяной знак {table} изменен другим процессом, "
+                f"продолжаем с {self.get_watermark(table)}"
+            )
+        return not conflicts
+
+    def rewind_watermarks(self, watermarks: Dict[str, Tuple[datetime.datetime, str]]) -> None:
+        """Откатить водяные знаки таблиц назад; водяные знаки, уже меньшие, не меняются.
+
+        Сравнение идет со свежим состоянием хранилища и повторяется, если
+        работающий процесс успел сдвинуть водяной знак между чтением и записью.
+        """
+        while True:
+            self.state = self.storage.load_state()
+            rewound = {
+                table: watermark
+                for table, watermark in watermarks.items()
+                if self.get_state(table) and watermark < self.get_watermark(table)
+            }
+            if not rewound or self.save_watermarks(rewound):
+                return
+
+    def get_state(self, table: str) -> Optional[Any]:
+        """Получить последнее сохраненное состояние для таблицы.
+
+        Читается из памяти: состояние загружается из хранилища при старте
+        и обновляется при каждой записи.
+        """
+        return (self.state or {}).get(table)
+
+    def get_watermark(self, table: str) -> Tuple[datetime.datetime, str]:
+        """Получить водяной знак (modified, id) для таблицы."""
+        value = self.get_state(table)
+        if not value:
+            return datetime.datetime.min, MIN_ID
+        # Старый формат состояния хранил только время
+        if isinstance(value, str):
+            return datetime.datetime.fromisoformat(value), MIN_ID
+        return datetime.datetime.fromisoformat(value["modified"]), value["id"]
@@ -1,4 +1,11 @@
-from typing import List, Dict, Any, Tuple
+from typing import Iterable, Iterator, List, Dict, Any, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ROLES = ("director", "actor", "writer")
 
 
 class Transformer:
@@ -8,6 +15,100 @@ class Transformer:
         transformed_data = [self._transform_film(film) for film in grouped_films]
         return transformed_data
 
+    def stream(self, films: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Потоковое преобразование фильмов.
+
+        Ожидает строки, отсортированные по fw_id, и отдает фильм сразу,
+        как только пришли все его строки, не накапливая весь результат в памяти.
+        """
+        current = None
+        for film in films:
+            if current is not None and current["id"] != film["fw_id"]:
+                yield self._transform_film(self._finalize_film(current))
+                current = None
+            if current is None:
+                current = self._new_film(film)
+            self._add_row(current, film)
+
+        if current is not None:
+            yield self._transform_film(self._finalize_film(current))
+
+    def stream_aggregated(
+        self, films: Iterable[Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        """Быстрое преобразование строк, уже агрегированных в базе (одна строка на фильм)."""
+        for film in films:
+            yield {
+                "id": str(film["fw_id"]),
+                "title": film["title"],
+                "description": film["description"],
+                "imdb_rating": film["rating"],
+                "creation_date": film["creation_date"],
+                "type": film["type"],
+                "genres": film["genres"],
+                "directors_names": [person["name"] for person in film["directors"]],
+                "actors_names": [person["name"] for person in film["actors"]],
+                "writers_names": [person["name"] for person in film["writers"]],
+                "directors": film["directors"],
+                "actors": film["actors"],
+                "writers": film["writers"],
+            }
+
+    def stream_columns(
+        self, batches: Iterable[Dict[str, Sequence[Any]]]
+    ) -> Iterator[Dict[str, Any]]:
+        """Преобразование строк, переданных столбцами (результат fetch_columns).
+
+        Строки в столбцах отсортированы по fw_id: границы фильмов находятся
+        одним сравнением соседних значений (через numpy, если он установлен),
+        а каждый фильм собирается из срезов столбцов без словаря на строку.
+        Результат совпадает с stream.
+        """
+        for columns in batches:
+            fw_ids = columns["fw_id"]
+            roles = columns["role"]
+            person_ids = columns["person_id"]
+            person_names = columns["person_name"]
+            genre_names = columns["genre_name"]
+            bounds = self._group_bounds(fw_ids)
+
+            for start, end in zip(bounds, bounds[1:]):
+                people: Dict[str, set] = {role: set() for role in ROLES}
+                for role, person in zip(
+                    roles[start:end], zip(person_ids[start:end], person_names[start:end])
+                ):
+                    if role in people:
+                        people[role].add(person)
+
+                yield self._transform_film(
+                    {
+                        "id": fw_ids[start],
+                        "title": columns["title"][start],
+                        "description": columns["description"][start],
+                        "imdb_rating": columns["rating"][start],
+                        "creation_date": columns["creation_date"][start],
+                        "type": columns["type"][start],
+                        "genres": sorted({name for name in genre_names[start:end] if name}),
+                        "directors": self._sorted_people(people["director"]),
+                        "actors": self._sorted_people(people["actor"]),
+                        "writers": self._sorted_people(people["writer"]),
+                    }
+                )
+
+    def _group_bounds(self, fw_ids: Sequence[Any]) -> List[int]:
+        """Индексы начала каждого фильма в отсортированном столбце плюс конец столбца."""
+        if not fw_ids:
+            return []
+        if numpy is not None:
+            values = numpy.asarray(fw_ids, dtype=object)
+            starts = numpy.flatnonzero(values[1:] != values[:-1]) + 1
+            return [0, *starts.tolist(), len(fw_ids)]
+        return [
+            0,
+            *(index for index in range(1, len(fw_ids)) if fw_ids[index] != fw_ids[index - 1]),
+            len(fw_ids),
+        ]
+
     def _group_films_by_id(self, films: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Группирует фильмы по fw_id, собирая информацию о людях по ролям."""
         film_dict = {}
@@ -15,38 +116,56 @@ class Transformer:
         for film in films:
             fw_id = film["fw_id"]
             if fw_id not in film_dict:
-                film_dict[fw_id] = {
-                    "id": fw_id,
-                    "title": film["title"],
-                    "description": film["description"],
-                    "imdb_rating": film["rating"],
-                    "genres": set(),
-                    "directors": set(),
-                    "actors": set(),
-                    "writers": set(),
-                }
-
-            # Добавляем жанры
-            if film["genre_name"]:
-                film_dict[fw_id]["genres"].add(film["genre_name"])
-
-            # Распределяем людей по ролям
-            person_info = (film["person_id"], film["person_name"])
-            if film["role"] == "director":
-                film_dict[fw_id]["directors"].add(person_info)
-            elif film["role"] == "actor":
-                film_dict[fw_id]["actors"].add(person_info)
-            elif film["role"] == "writer":
-                film_dict[fw_id]["writers"].add(person_info)
-
-        # Преобразуем множества в списки
-        for film in film_dict.values():
-            film["genres"] = list(film["genres"])
-            film["directors"] = list(film["directors"])
-            film["actors"] = list(film["actors"])
-            film["writers"] = list(film["writers"])
-
-        return list(film_dict.values())
+                film_dict[fw_id] = self._new_film(film)
+            self._add_row(film_dict[fw_id], film)
+
+        return [self._finalize_film(film) for film in film_dict.values()]
+
+    def _new_film(self, film: Dict[str, Any]) -> Dict[str, Any]:
+        """Создает заготовку фильма по первой строке выборки."""
+        return {
+            "id": film["fw_id"],
+            "title": film["title"],
+            "description": film["description"],
+            "imdb_rating": film["rating"],
+            "creation_date": film["creation_date"],
+            "type": film["type"],
+            "genres": set(),
+            "directors": set(),
+            "actors": set(),
+            "writers": set(),
+        }
+
+    def _add_row(self, grouped: Dict[str, Any], film: Dict[str, Any]) -> None:
+        """Добавляет жанр и персону из очередной строки выборки."""
+        # Добавляем жанры
+        if film["genre_name"]:
+            grouped["genres"].add(film["genre_name"])
+
+        # Распределяем людей по ролям
+        person_info = (film["person_id"], film["person_name"])
+        if film["role"] == "director":
+            grouped["directors"].add(person_info)
+        elif film["role"] == "actor":
+            grouped["actors"].add(person_info)
+        elif film["role"] == "writer":
+            grouped["writers"].add(person_info)
+
+    def _finalize_film(self, film: Dict[str, Any]) -> Dict[str, Any]:
+        """Преобразует множества в отсортированные списки.
+
+        Порядок стабилен между запусками (как в агрегированном режиме),
+        поэтому неизменный фильм дает побайтно тот же документ.
+        """
+        film["genres"] = sorted(film["genres"])
+        film["directors"] = self._sorted_people(film["directors"])
+        film["actors"] = self._sorted_people(film["actors"])
+        film["writers"] = self._sorted_people(film["writers"])
+        return film
+
+    def _sorted_people(self, people: Iterable[Tuple[Any, str]]) -> List[Tuple[Any, str]]:
+        """Сортирует персоны по id, затем по имени."""
+        return sorted(people, key=lambda person: (str(person[0]), person[1]))
 
     def _transform_film(self, film: Dict[str, Any]) -> Dict[str, Any]:
         """Преобразует отдельный фильм в нужный формат для Elasticsearch."""
@@ -55,6 +174,8 @@ class Transformer:
             "title": film["title"],
             "description": film["description"],
             "imdb_rating": film["imdb_rating"],
+            "creation_date": film["creation_date"],
+            "type": film["type"],
             "genres": film["genres"],
             "directors_names": [name for _, name in film["directors"]],
             "actors_names": [name for _, name in film["actors"]],
@@ -0,0 +1,236 @@
+import asyncio
+import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from AsyncElasticSearchClient import AsyncElasticSearchClient
+from AsyncPostgresClient import AsyncPostgresClient
+from backoff import async_backoff
+from main import report_read_horizon, track_ids
+from PostgresClient import FILM_LINK_LOGS
+from config import BACKOFF_CONFIG, ETL_SETTINGS
+from DeadLetterStore import DeadLetterStore
+from logging_config import logger
+import metrics
+from StateManager import StateManager, create_storage
+from Transformer import Transformer
+
+# Раунд: таблица -> страница ее изменений
+Round = Dict[str, List[Dict[str, Any]]]
+
+
+class AsyncMain:
+    """Асинхронный движок ETL.
+
+    Страницы таблиц-источников выбираются конкурентно, а выборка следующего
+    раунда идет параллельно с загрузкой предыдущего. Водяные знаки
+    сдвигаются только после загрузки раунда, как и в Main. Блокирующие
+    операции (состояние, DeadLetterStore) выполняются через asyncio.to_thread.
+    """
+
+    def __init__(self) -> None:
+        self.pg_client = AsyncPostgresClient()
+        self.es_client = AsyncElasticSearchClient()
+        self.transformer = Transformer()
+        self.state_manager = StateManager(create_storage())
+        self.dead_letters = DeadLetterStore(
+            ETL_SETTINGS.dead_letter_file_path, ETL_SETTINGS.dead_letter_max_attempts
+        )
+
+        if ETL_SETTINGS.film_details_mode == "aggregated":
+            self.get_film_details = self.pg_client.get_film_details_aggregated
+            self.transform = self.transformer.stream_aggregated
+        elif ETL_SETTINGS.film_details_mode == "denorm":
+            self.get_film_details = self.pg_client.get_film_details_denorm
+            self.transform = self.transformer.stream_aggregated
+        elif ETL_SETTINGS.film_details_mode == "columnar":
+            self.get_film_details = self.pg_client.get_film_details_columns
+            self.transform = self.transformer.stream_columns
+        else:
+            self.get_film_details = self.pg_client.get_film_details
+            self.transform = self.transformer.stream
+
+        self.tables: Dict[
+            str,
+            tuple[
+                Callable[[datetime.datetime, str, int], AsyncIterator[Dict[str, Any]]],
+                Callable[[List[Dict[str, Any]]], Awaitable[List[Any]]],
+            ],
+        ] = {
+            "film_work": (
+                self.pg_client.get_updated_film_ids,
+                lambda rows: self._column(rows, "id"),
+            ),
+            "person": (
+                self.pg_client.get_updated_person_ids,
+                lambda rows: self._collect_ids(
+                    self.pg_client.get_film_ids_by_person_ids, [row["id"] for row in rows]
+                ),
+            ),
+            "genre": (
+                self.pg_client.get_updated_genre_ids,
+                lambda rows: self._collect_ids(
+                    self.pg_client.get_film_ids_by_genre_ids, [row["id"] for row in rows]
+                ),
+            ),
+            "person_film_work_log": (
+                self.pg_client.get_updated_person_film_work_links,
+                lambda rows: self._column(rows, "film_work_id"),
+            ),
+            "genre_film_work_log": (
+                self.pg_client.get_updated_genre_film_work_links,
+                lambda rows: self._column(rows, "film_work_id"),
+            ),
+        }
+
+        self.watermarks = {
+            table: self.state_manager.get_watermark(table) for table in self.tables
+        }
+
+    async def _column(self, rows: List[Dict[str, Any]], column: str) -> List[Any]:
+        """ID фильмов уже есть в строках страницы."""
+        return list({row[column] for row in rows})
+
+    async def _collect_ids(
+        self, fetch: Callable[..., AsyncIterator[Dict[str, Any]]], *args: Any
+    ) -> List[Any]:
+        """Собирает ID из результата запроса."""
+        return [record["id"] for record in await self._collect(fetch, *args)]
+
+    @async_backoff(**BACKOFF_CONFIG.model_dump())
+    async def _collect(
+        self, fetch: Callable[..., AsyncIterator[Dict[str, Any]]], *args: Any
+    ) -> List[Dict[str, Any]]:
+        """Собирает результат запроса в список, при ошибке повторяя запрос с начала."""
+        return [record async for record in fetch(*args)]
+
+    async def index_films(self, film_ids: List[Any]) -> None:
+        """Обогащает и индексирует фильмы, отклоненные документы уходят в DeadLetterStore.
+
+        Фильмы выбираются срезами по page_size, как в Main.
+        Из DeadLetterStore убираются только фильмы, документы которых загружены.
+        """
+        indexed: Set[str] = set()
+        failed: Dict[str, str] = {}
+        for start in range(0, len(film_ids), ETL_SETTINGS.page_size):
+            films = await self._collect(
+                self.get_film_details, film_ids[start:start + ETL_SETTINGS.page_size]
+            )
+            failed.update(await self.es_client.load_data(track_ids(self.transform(films), indexed)))
+        await asyncio.to_thread(self._record_results, film_ids, indexed, failed)
+
+    def _record_results(
+        self, film_ids: List[Any], indexed: Set[str], failed: Dict[str, str]
+    ) -> None:
+        """Обновляет DeadLetterStore по результату загрузки (запись файла с fsync)."""
+        self.dead_letters.resolve(film_id for film_id in indexed if film_id not in failed)
+        missing = {
+            str(film_id): "Документ фильма не сформирован"
+            for film_id in film_ids
+            if str(film_id) not in indexed and film_id in self.dead_letters
+        }
+        self.dead_letters.add({**failed, **missing})
+
+    async def retry_dead_letters(self) -> None:
+        """Повторяет индексацию фильмов из DeadLetterStore."""
+        film_ids = self.dead_letters.pending(ETL_SETTINGS.page_size)
+        if film_ids:
+            logger.info(f"Повторная индексация фильмов с ошибками: {len(film_ids)}")
+            await self.index_films(film_ids)
+
+    async def fetch_page(
+        self, table: str, last_modified: datetime.datetime, last_id: str
+    ) -> List[Dict[str, Any]]:
+        """Выбирает страницу изменений таблицы после (last_modified, last_id)."""
+        logger.info(
+            f"Обрабатываем таблицу: {table}, "
+            f"last_modified: {last_modified}, last_id: {last_id}"
+        )
+        return await self._collect(
+            self.tables[table][0], last_modified, last_id, ETL_SETTINGS.page_size
+        )
+
+    async def extract(self, queue: "asyncio.Queue[Optional[Round]]", stop: asyncio.Event) -> None:
+        """Выбирает раунды изменений и кладет их в очередь на загрузку.
+
+        Раунд - по странице каждой таблицы, страницы выбираются конкурентно.
+        """
+        positions = dict(self.watermarks)
+        while not stop.is_set():
+            report_read_horizon(await self._collect(self.pg_client.get_oldest_transaction_age))
+            pages = await asyncio.gather(
+                *(self.fetch_page(table, *positions[table]) for table in self.tables)
+            )
+            round_pages: Round = {}
+            for table, page in zip(self.tables, pages):
+                if not page:
+                    logger.info(f"Нет обновлений для {table}")
+                    metrics.set_replication_lag(table, None)
+                    continue
+                round_pages[table] = page
+                positions[table] = (page[-1]["modified"], str(page[-1]["id"]))
+            if not round_pages:
+                break
+
+            await queue.put(round_pages)
+            if all(len(page) < ETL_SETTINGS.page_size for page in round_pages.values()):
+                break
+
+        await queue.put(None)
+
+    async def load(self, queue: "asyncio.Queue[Optional[Round]]", stop: asyncio.Event) -> None:
+        """Загружает раунды из очереди и сдвигает водяные знаки, как Main.run_round.
+
+        ID фильмов раунда объединяются по всем таблицам: каждый фильм
+        индексируется один раз, и более старый снимок фильма не попадает
+        в индекс после более нового. Если водяной знак в хранилище откатила
+        полная переиндексация, оставшиеся раунды пропускаются, и следующий
+        цикл начинается с откатанных водяных знаков.
+        """
+        while (round_pages := await queue.get()) is not None:
+            if stop.is_set():
+                continue
+
+            film_ids: Set[Any] = set()
+            for ids in await asyncio.gather(
+                *(self.tables[table][1](page) for table, page in round_pages.items())
+            ):
+                film_ids.update(ids)
+            logger.info(f"Затронуто фильмов: {len(film_ids)}")
+            if film_ids:
+                await self.index_films(list(film_ids))
+
+            watermarks = {
+                table: (page[-1]["modified"], str(page[-1]["id"]))
+                for table, page in round_pages.items()
+            }
+            if not await asyncio.to_thread(self.state_manager.save_watermarks, watermarks):
+                stop.set()
+            for table, page in round_pages.items():
+                watermark = self.state_manager.get_watermark(table)
+                self.watermarks[table] = watermark
+                if ETL_SETTINGS.prune_film_links_log and table in FILM_LINK_LOGS:
+                    await self.pg_client.delete_film_links_log(FILM_LINK_LOGS[table], *watermark)
+                metrics.set_replication_lag(
+                    table, watermark[0] if len(page) >= ETL_SETTINGS.page_size else None
+                )
+                logger.info(f"Состояние обновлено для {table} до {watermark}")
+
+    async def process_rounds(self) -> None:
+        """Запускает выборку и загрузку раундов с перекрытием."""
+        queue: "asyncio.Queue[Optional[Round]]" = asyncio.Queue(maxsize=1)
+        stop = asyncio.Event()
+        async with asyncio.TaskGroup() as group:
+            group.create_task(self.extract(queue, stop))
+            group.create_task(self.load(queue, stop))
+
+    async def mainloop(self) -> None:
+        await self.es_client.create_index()
+        try:
+            while True:
+                await self.retry_dead_letters()
+                await self.process_rounds()
+
+                await asyncio.sleep(ETL_SETTINGS.poll_interval)
+        finally:
+            await self.pg_client.close()
+            await self.es_client.close()
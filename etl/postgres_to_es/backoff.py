@@ -1,8 +1,11 @@
+import asyncio
 import time
 import logging
 from functools import wraps
 from typing import Any, Callable
 
+from metrics import RETRIES
+
 
 def backoff(
     start_sleep_time: float = 0.1,
@@ -23,6 +26,7 @@ def backoff(
                     return func(self, *args, **kwargs)
                 except Exception as e:
                     attempt += 1
+                    RETRIES.inc(function=func.__name__)
                     logging.warning(f"Попытка {attempt}: Ошибка в {func.__name__}: {e}")
 
                     if attempt >= max_attempts:
@@ -40,3 +44,42 @@ def backoff(
         return inner
 
     return func_wrapper
+
+
+def async_backoff(
+    start_sleep_time: float = 0.1,
+    factor: float = 2,
+    border_sleep_time: float = 10,
+    max_attempts: int = 10
+) -> Callable:
+    """Вариант backoff для корутин: ожидание через asyncio.sleep."""
+
+    def func_wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(func)
+        async def inner(self, *args: Any, **kwargs: Any) -> Any:
+            attempt = 0
+            delay = start_sleep_time
+
+            while attempt < max_attempts:
+                try:
+                    return await func(self, *args, **kwargs)
+                except Exception as e:
+                    attempt += 1
+                    RETRIES.inc(function=func.__name__)
+                    logging.warning(f"Попытка {attempt}: Ошибка в {func.__name__}: {e}")
+
+                    if attempt >= max_attempts:
+                        logging.error(f"Превышено максимальное количество попыток ({max_attempts})")
+                        raise e
+
+                    if delay >= border_sleep_time:
+                        delay = border_sleep_time
+                    else:
+                        delay = start_sleep_time * (factor**attempt)
+
+                    logging.info(f"Повтор через {delay:.2f} секунд")
+                    await asyncio.sleep(delay)
+
+        return inner
+
+    return func_wrapper
@@ -1,7 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
-from typing import Any, Dict
+from typing import Any, Dict, Literal
 
 
 class PostgresLocal(BaseSettings):
@@ -27,6 +27,7 @@ class ElasticConfig(BaseSettings):
     password: str = Field(..., alias="ELASTIC_PASSWORD")
     method: str = "http"
     index: str = "movies"
+    replicas: int = 1
 
 
 class BackoffConfig(BaseSettings):
@@ -39,7 +40,38 @@ class BackoffConfig(BaseSettings):
 class ETLSettings(BaseSettings):
     batch_size: int = 100
     state_file_path: str = "state/state.json"
+    state_storage: Literal["json", "postgres"] = "json"
+    dead_letter_file_path: str = "state/dead_letter.json"
+    dead_letter_max_attempts: int = 5
+    shards: int = 8
+    metrics_port: int = 9100
+    lease_ttl: float = 60
     chunk_size: int = 100
+    page_size: int = 1000
+    poll_interval: float = 10
+    pg_notify_channel: str = "etl_changes"
+    notify_window: float = 1.0
+    notify_max_batch: int = 1000
+    reconcile_interval: float = 600
+    prune_film_links_log: bool = True
+    read_lag: float = 30
+    read_max_lag: float = 600
+    es_bulk_workers: int = 1
+    es_bulk_queue_size: int = 2
+    es_bulk_bytes: int = 5 * 1024 * 1024
+    es_bulk_min_bytes: int = 512 * 1024
+    es_bulk_max_bytes: int = 15 * 1024 * 1024
+    es_bulk_target_latency: float = 1.0
+    es_bulk_adaptive: bool = True
+    es_skip_unchanged: bool = True
+    es_partial_updates: bool = False
+    doc_hash_file_path: str = "state/doc_hashes.sqlite3"
+    serializer: Literal["auto", "orjson", "json"] = "auto"
+    pg_use_pool: bool = True
+    pg_pool_size: int = 5
+    pg_pool_timeout: float = 30
+    pg_server_side_cursors: bool = True
+    film_details_mode: Literal["join", "aggregated", "columnar", "denorm"] = "join"
 
 
 POSTGRES_LOCAL = PostgresLocal()
@@ -83,6 +115,8 @@ INDEX_SETTINGS: Dict[str, Any] = {
             "properties": {
                 "id": {"type": "keyword"},
                 "imdb_rating": {"type": "float"},
+                "creation_date": {"type": "date"},
+                "type": {"type": "keyword"},
                 "genres": {"type": "keyword"},
                 "title": {
                     "type": "text",
@@ -90,9 +124,21 @@ INDEX_SETTINGS: Dict[str, Any] = {
                     "fields": {"raw": {"type": "keyword"}},
                 },
                 "description": {"type": "text", "analyzer": "ru_en"},
-                "directors_names": {"type": "text", "analyzer": "ru_en"},
-                "actors_names": {"type": "text", "analyzer": "ru_en"},
-                "writers_names": {"type": "text", "analyzer": "ru_en"},
+                "directors_names": {
+                    "type": "text",
+                    "analyzer": "ru_en",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "actors_names": {
+                    "type": "text",
+                    "analyzer": "ru_en",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "writers_names": {
+                    "type": "text",
+                    "analyzer": "ru_en",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
                 "directors": {
                     "type": "nested",
                     "dynamic": "strict",
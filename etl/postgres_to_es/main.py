@@ -1,90 +1,684 @@
+import argparse
+import asyncio
 import datetime
+import functools
+import multiprocessing
+import threading
 import time
-from typing import Any, Callable, Dict
-from config import ETL_SETTINGS
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from backoff import backoff
+from config import BACKOFF_CONFIG, ETL_SETTINGS
+from DeadLetterStore import DeadLetterStore
+from LeaseManager import LeaseLostError, LeaseManager, Shard
 from Transformer import Transformer
-from StateManager import StateManager, JsonFileStorage
-from PostgresClient import PostgresClient
+from StateManager import MIN_ID, StateManager, create_storage, namespaced_path
+from PostgresClient import ALL_FILMS, FILM_LINK_LOGS, MAX_ID, PostgresClient
 from ElasticSearchClient import ElasticSearchClient
 from logging_config import logger
+import metrics
+
+# Таблица из уведомления LISTEN/NOTIFY -> таблица-источник опроса
+# и колонка ее строк, значение которой приходит в уведомлении
+NOTIFIED_SOURCES: Dict[str, Tuple[str, str]] = {
+    "film_work": ("film_work", "id"),
+    "person": ("person", "id"),
+    "genre": ("genre", "id"),
+    "person_film_work": ("person_film_work_log", "film_work_id"),
+    "genre_film_work": ("genre_film_work_log", "film_work_id"),
+}
+
+
+def track_ids(documents: Iterable[Dict[str, Any]], ids: Set[str]) -> Iterator[Dict[str, Any]]:
+    """Пропускает документы дальше, запоминая их ID."""
+    for document in documents:
+        ids.add(str(document["id"]))
+        yield document
+
+
+def report_read_horizon(records: List[Dict[str, Any]]) -> None:
+    """Экспортирует отставание границы чтения (READ_HORIZON) и предупреждает, если ее держат.
+
+    records - результат PostgresClient.get_oldest_transaction_age.
+    """
+    age = records[0]["age"] if records else 0.0
+    lag = min(max(age, ETL_SETTINGS.read_lag), ETL_SETTINGS.read_max_lag)
+    metrics.READ_HORIZON_LAG.set(lag)
+    if age > ETL_SETTINGS.read_max_lag:
+        logger.warning(
+            f"Транзакция открыта {age:.0f} с, дольше read_max_lag: граница чтения "
+            f"сдвинута без нее, ее изменения могут быть пропущены до полной переиндексации"
+        )
+    elif age > ETL_SETTINGS.read_lag:
+        logger.warning(f"Границу чтения держит транзакция, открытая {age:.0f} с")
 
 
 class Main:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        shard: Optional[Shard] = None,
+        pg_client: Optional[PostgresClient] = None,
+        es_client: Optional[ElasticSearchClient] = None,
+        leases: Optional[LeaseManager] = None,
+    ) -> None:
         """
         Инициализация класса Main, создание клиентов
         для работы с PostgreSQL и Elasticsearch,
         а также настройка состояния и загрузки данных.
+
+        Если передан shard, обрабатываются только фильмы из его диапазона ID
+        (диапазон передается в запросы), а водяные знаки и очередь повторов
+        хранятся отдельно для шарда.
+        С leases аренда шарда проверяется перед каждым сохранением водяных знаков.
         """
-        self.pg_client = PostgresClient()
-        self.es_client = ElasticSearchClient()
+        self.shard = shard
+        self.film_range = (shard.first_id, shard.last_id) if shard else ALL_FILMS
+        self.leases = leases
+        namespace = shard.name if shard else None
+        self.pg_client = pg_client or PostgresClient()
+        self.es_client = es_client or ElasticSearchClient()
         self.transformer = Transformer()
-        self.state_manager = StateManager(JsonFileStorage(ETL_SETTINGS.state_file_path))
-        self.state_manager.add_listener(
-            lambda ids, table: self.es_client.load_data(
-                self.transformer(self.tables[table][1](ids))
-            )
+        self.state_manager = StateManager(create_storage(namespace))
+        self.dead_letters = DeadLetterStore(
+            namespaced_path(ETL_SETTINGS.dead_letter_file_path, namespace),
+            ETL_SETTINGS.dead_letter_max_attempts,
         )
-        self.es_client.create_index()
+        if ETL_SETTINGS.film_details_mode == "aggregated":
+            self.get_film_details = self.pg_client.get_film_details_aggregated
+            self.transform = self.transformer.stream_aggregated
+        elif ETL_SETTINGS.film_details_mode == "denorm":
+            self.get_film_details = self.pg_client.get_film_details_denorm
+            self.transform = self.transformer.stream_aggregated
+        elif ETL_SETTINGS.film_details_mode == "columnar":
+            self.get_film_details = self.pg_client.get_film_details_columns
+            self.transform = self.transformer.stream_columns
+        else:
+            self.get_film_details = self.pg_client.get_film_details
+            self.transform = self.transformer.stream
+        self.state_manager.add_listener(self.index_films)
 
         self.tables: Dict[
             str,
             tuple[
                 Callable[
-                    [datetime.datetime],
-                    list[int]], Callable[[list[int]], Any]
+                    [datetime.datetime, str, int],
+                    Iterable[Dict[str, Any]]],
+                Callable[[List[Dict[str, Any]]], Iterable[Any]]
             ],
         ] = {
             "film_work": (
-                self.pg_client.get_updated_film_ids,
-                lambda ids: self.pg_client.get_film_details(ids),
+                functools.partial(
+                    self.pg_client.get_updated_film_ids, film_range=self.film_range
+                ),
+                lambda rows: (row["id"] for row in rows),
             ),
             "person": (
                 self.pg_client.get_updated_person_ids,
-                lambda ids: self.pg_client.get_film_details(
-                    [
-                        film["id"]
-                        for film in self.pg_client.get_film_ids_by_person_ids(ids)
-                    ]
+                lambda rows: (
+                    film["id"]
+                    for film in self.fetch_all(
+                        self.pg_client.get_film_ids_by_person_ids,
+                        [row["id"] for row in rows],
+                        self.film_range,
+                    )
                 ),
             ),
             "genre": (
                 self.pg_client.get_updated_genre_ids,
-                lambda ids: self.pg_client.get_film_details(
-                    [
-                        film["id"]
-                        for film in self.pg_client.get_film_ids_by_genre_ids(ids)
-                    ]
+                lambda rows: (
+                    film["id"]
+                    for film in self.fetch_all(
+                        self.pg_client.get_film_ids_by_genre_ids,
+                        [row["id"] for row in rows],
+                        self.film_range,
+                    )
+                ),
+            ),
+            "person_film_work_log": (
+                functools.partial(
+                    self.pg_client.get_updated_person_film_work_links,
+                    film_range=self.film_range,
+                ),
+                lambda rows: (row["film_work_id"] for row in rows),
+            ),
+            "genre_film_work_log": (
+                functools.partial(
+                    self.pg_client.get_updated_genre_film_work_links,
+                    film_range=self.film_range,
                 ),
+                lambda rows: (row["film_work_id"] for row in rows),
             ),
         }
 
-        self.last_modified_by_table = {
-            table: self.state_manager.get_state(table) or datetime.datetime.min
-            for table in self.tables
+        self.watermarks = {
+            table: self.state_manager.get_watermark(table) for table in self.tables
         }
+        # Ключи строк, уже обработанных по уведомлениям с последней сверки
+        self.notified: Dict[str, Set[str]] = {table: set() for table in self.tables}
+
+    def close(self) -> None:
+        """Закрывает хранилище состояния; переданные клиенты закрывает их владелец."""
+        self.state_manager.storage.close()
+
+    def check_lease(self) -> None:
+        """Продлевает аренду шарда перед сохранением водяных знаков.
+
+        Если за время раунда шард забрал другой воркер, водяные знаки
+        не сохраняются: изменения раунда обработает новый владелец.
+        """
+        if self.leases is not None and self.shard not in self.leases.renew():
+            raise LeaseLostError(self.shard.name)
+
+    def index_films(self, film_ids: List[Any]) -> None:
+        """Обогащает и индексирует фильмы.
+
+        Документы, отклоненные ES, попадают в DeadLetterStore и повторяются
+        в следующих циклах, поэтому водяные знаки можно сдвигать дальше.
+        Из DeadLetterStore убираются только фильмы, документы которых загружены;
+        повтор фильма, по которому документ не сформирован (например, удаленного),
+        считается неудачной попыткой.
+        Если не удалась выборка или весь bulk-запрос, исключение пробрасывается
+        и водяные знаки остаются на месте.
+        """
+        indexed, failed = self.load_films(film_ids)
+        self.dead_letters.resolve(film_id for film_id in indexed if film_id not in failed)
+        missing = {
+            str(film_id): "Документ фильма не сформирован"
+            for film_id in film_ids
+            if str(film_id) not in indexed and film_id in self.dead_letters
+        }
+        self.dead_letters.add({**failed, **missing})
+
+    def load_films(
+        self, film_ids: List[Any], index: Optional[str] = None
+    ) -> Tuple[Set[str], Dict[str, str]]:
+        """Выборка, преобразование и загрузка фильмов с замером времени этапов.
+
+        Возвращает ID фильмов, по которым сформированы документы,
+        и документы, отклоненные ES, с причинами ошибок.
+        """
+        indexed: Set[str] = set()
+        with metrics.stage("load"):
+            details = metrics.timed(self.stream_details(film_ids), "extract")
+            failed = self.es_client.load_data(
+                track_ids(metrics.timed(self.transform(details), "transform"), indexed),
+                index=index,
+            )
+        return indexed, failed
+
+    def stream_details(self, film_ids: List[Any]) -> Iterator[Dict[str, Any]]:
+        """Лениво выбирает подробности фильмов срезами по page_size фильмов.
+
+        Каждый срез выбирается отдельным запросом, поэтому размер запроса
+        ограничен и тогда, когда персона или жанр затронули много фильмов.
+        """
+        for start in range(0, len(film_ids), ETL_SETTINGS.page_size):
+            yield from self.stream_details_slice(
+                [str(film_id) for film_id in film_ids[start:start + ETL_SETTINGS.page_size]]
+            )
+
+    def stream_details_slice(self, film_ids: List[str]) -> Iterator[Dict[str, Any]]:
+        """Выбирает срез фильмов, при ошибке повторяя запрос для еще не отданных фильмов.
+
+        Задержки между попытками те же, что у backoff. Строки фильма
+        передаются дальше, только когда пришли все они, поэтому повтор
+        не отдает фильм дважды и не обрывает его на середине.
+        """
+        done: Set[str] = set()
+        attempt = 0
+        while True:
+            pending = [film_id for film_id in film_ids if film_id not in done]
+            if not pending:
+                return
+            try:
+                yield from self._complete_films(self.get_film_details(pending), done)
+                return
+            except Exception as e:
+                attempt += 1
+                metrics.RETRIES.inc(function="stream_details_slice")
+                logger.warning(f"Попытка {attempt}: ошибка выборки фильмов: {e}")
+                if attempt >= BACKOFF_CONFIG.max_attempts:
+                    raise
+                time.sleep(
+                    min(
+                        BACKOFF_CONFIG.start_sleep_time * BACKOFF_CONFIG.factor**attempt,
+                        BACKOFF_CONFIG.border_sleep_time,
+                    )
+                )
+
+    @staticmethod
+    def _complete_films(
+        records: Iterable[Dict[str, Any]], done: Set[str]
+    ) -> Iterator[Dict[str, Any]]:
+        """Отдает записи выборки по фильмам целиком, отмечая отданные фильмы в done.
+
+        Строки одного фильма идут подряд (ORDER BY fw.id). В режиме columnar
+        запись - столбцы всего среза, она отдается целиком.
+        """
+        rows: List[Dict[str, Any]] = []
+        for record in records:
+            if isinstance(record["fw_id"], (list, tuple)):
+                yield record
+                done.update(map(str, record["fw_id"]))
+                continue
+            if rows and rows[0]["fw_id"] != record["fw_id"]:
+                yield from rows
+                done.add(str(rows[0]["fw_id"]))
+                rows = []
+            rows.append(record)
+        if rows:
+            yield from rows
+            done.add(str(rows[0]["fw_id"]))
+
+    @backoff(**BACKOFF_CONFIG.model_dump())
+    def fetch_all(
+        self, fetch: Callable[..., Iterable[Dict[str, Any]]], *args: Any
+    ) -> List[Dict[str, Any]]:
+        """Выбирает результат запроса целиком, при ошибке повторяя его с начала.
+
+        Генератор PostgresClient нельзя продолжить после сбоя,
+        поэтому повторяется весь запрос страницы.
+        """
+        return list(metrics.timed(fetch(*args), "extract"))
+
+    def retry_dead_letters(self) -> None:
+        """Повторяет индексацию фильмов из DeadLetterStore."""
+        film_ids = self.dead_letters.pending(ETL_SETTINGS.page_size)
+        if film_ids:
+            logger.info(f"Повторная индексация фильмов с ошибками: {len(film_ids)}")
+            self.index_films(film_ids)
+
+    def fetch_page(self, table: str) -> List[Dict[str, Any]]:
+        """Выбирает очередную страницу изменений таблицы по (modified, id)."""
+        last_modified, last_id = self.watermarks[table]
+
+        logger.info(
+            f"Обрабатываем таблицу: {table}, "
+            f"last_modified: {last_modified}, last_id: {last_id}"
+        )
+
+        return self.fetch_all(
+            self.tables[table][0], last_modified, last_id, ETL_SETTINGS.page_size
+        )
+
+    def skip_notified(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Убирает из страницы строки, которые уже обработаны по уведомлениям.
+
+        Водяной знак при этом сдвигается по всей странице, поэтому сверка
+        не переиндексирует фильмы, уже загруженные событийным режимом.
+        """
+        notified = self.notified[table]
+        if not notified:
+            return rows
+        column = next(
+            column for source, column in NOTIFIED_SOURCES.values() if source == table
+        )
+        fresh = [row for row in rows if str(row[column]) not in notified]
+        if len(fresh) < len(rows):
+            logger.info(
+                f"Пропущено записей {table}, обработанных по уведомлениям: "
+                f"{len(rows) - len(fresh)}"
+            )
+        return fresh
+
+    def run_round(self) -> bool:
+        """Обрабатывает по одной странице каждой таблицы.
+
+        ID затронутых фильмов из всех таблиц собираются в одно множество,
+        поэтому каждый фильм обогащается и индексируется один раз за раунд.
+        Возвращает True, если хотя бы у одной таблицы остались изменения.
+        """
+        film_ids: Set[Any] = set()
+        affected = 0
+        watermarks: Dict[str, Tuple[datetime.datetime, str]] = {}
+        pending: Set[str] = set()
+        has_more = False
+
+        report_read_horizon(self.fetch_all(self.pg_client.get_oldest_transaction_age))
+        for table in self.tables:
+            updated_ids = self.fetch_page(table)
+            if not updated_ids:
+                logger.info(f"Нет обновлений для {table}")
+                metrics.set_replication_lag(table, None)
+                continue
+
+            logger.info(f"Количество обновленных записей в {table}: {len(updated_ids)}")
+            rows = self.skip_notified(table, updated_ids)
+            for film_id in self.tables[table][1](rows) if rows else ():
+                film_ids.add(film_id)
+                affected += 1
+
+            watermarks[table] = (updated_ids[-1]["modified"], str(updated_ids[-1]["id"]))
+            if len(updated_ids) >= ETL_SETTINGS.page_size:
+                has_more = True
+                pending.add(table)
+
+        if not watermarks:
+            return False
+
+        logger.info(
+            f"Затронуто фильмов: {len(film_ids)}, "
+            f"удалено дубликатов: {affected - len(film_ids)}"
+        )
+        self.state_manager.change_state(watermarks, list(film_ids), self.check_lease)
+        # Полная переиндексация могла откатить водяные знаки в хранилище
+        watermarks = {table: self.state_manager.get_watermark(table) for table in watermarks}
+        self.watermarks.update(watermarks)
+        for table, watermark in watermarks.items():
+            logger.info(f"Состояние обновлено для {table} до {watermark}")
+            # Пока в таблице остались изменения, отставание считается от водяного знака
+            metrics.set_replication_lag(table, watermark[0] if table in pending else None)
+            # Журнал читают все шарды, его чистит prune_film_links_logs
+            if (
+                ETL_SETTINGS.prune_film_links_log
+                and self.shard is None
+                and table in FILM_LINK_LOGS
+            ):
+                self.pg_client.delete_film_links_log(FILM_LINK_LOGS[table], *watermark)
+
+        return has_more
+
+    def full_reindex(self, workers: int = 1) -> None:
+        """Полная переиндексация фильмов в новый индекс за алиасом.
+
+        Все фильмы читаются страницами по id в индекс с отключенным refresh,
+        затем настройки восстанавливаются, и алиас атомарно переключается.
+        При workers > 1 диапазон ID делится на workers шардов,
+        каждый загружается отдельным процессом.
+        Водяные знаки откатываются к моменту старта, чтобы изменения,
+        попавшие за время загрузки в старый индекс, были доиндексированы.
+        """
+        started = {table: self.pg_client.get_max_modified(table) for table in self.tables}
+        index = self.es_client.create_versioned_index()
+
+        if workers > 1:
+            shards = [Shard(number, workers) for number in range(workers)]
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                results = list(executor.map(reindex_shard, [index] * workers, shards))
+        else:
+            results = [self.reindex_range(index)]
+
+        total = sum(count for count, _ in results)
+        for _, failed in results:
+            # Повтор пойдет уже через алиас, который к тому времени переключится
+            self.dead_letters.add(failed)
+
+        self.es_client.finish_reindex(index)
+        old_indices = self.es_client.swap_alias(index)
+        self.es_client.delete_indices(old_indices)
+
+        self._rewind_watermarks(self.state_manager, started)
+        self.watermarks = {
+            table: self.state_manager.get_watermark(table) for table in self.tables
+        }
+        if ETL_SETTINGS.shards > 1:
+            # Водяные знаки шардовых воркеров (режим --workers) откатываются так же
+            for number in range(ETL_SETTINGS.shards):
+                storage = create_storage(Shard(number, ETL_SETTINGS.shards).name)
+                try:
+                    self._rewind_watermarks(StateManager(storage), started)
+                finally:
+                    storage.close()
+
+        logger.info(f"Полная переиндексация завершена, фильмов: {total}")
+
+    def reindex_range(
+        self, index: str, last_id: str = MIN_ID, max_id: str = MAX_ID
+    ) -> Tuple[int, Dict[str, str]]:
+        """Загружает в индекс фильмы с ID из (last_id, max_id].
+
+        Возвращает количество фильмов и документы, отклоненные ES.
+        """
+        total = 0
+        failed: Dict[str, str] = {}
+        while True:
+            page = self.fetch_all(
+                self.pg_client.get_film_ids_page, last_id, ETL_SETTINGS.page_size, max_id
+            )
+            if not page:
+                break
+
+            film_ids = [row["id"] for row in page]
+            failed.update(self.load_films(film_ids, index=index)[1])
+            total += len(page)
+            last_id = str(page[-1]["id"])
+            logger.info(f"Переиндексировано фильмов: {total}")
+
+            if len(page) < ETL_SETTINGS.page_size:
+                break
+
+        return total, failed
+
+    def _rewind_watermarks(self, state_manager: StateManager, started: Dict[str, Any]) -> None:
+        """Откатывает водяные знаки к моменту старта полной переиндексации.
+
+        Работающий демон увидит откат при следующем сохранении водяных знаков
+        и доиндексирует изменения, попавшие за время загрузки в старый индекс.
+        """
+        state_manager.rewind_watermarks(
+            {
+                table: (max_modified, MIN_ID)
+                for table, max_modified in started.items()
+                if max_modified is not None
+            }
+        )
+
+    def catch_up(self) -> None:
+        """Обрабатывает раунды, пока в таблицах есть изменения после водяных знаков."""
+        self.retry_dead_letters()
+        while self.run_round():
+            pass
+
+    def process_notifications(self, notifications: List[Dict[str, Any]]) -> None:
+        """Индексирует фильмы, затронутые пачкой уведомлений LISTEN/NOTIFY.
+
+        Ключи обработанных строк запоминаются до следующей сверки,
+        чтобы она не загружала эти фильмы повторно.
+        """
+        ids_by_table: Dict[str, Set[Any]] = {}
+        for notification in notifications:
+            ids_by_table.setdefault(notification["table"], set()).add(notification["id"])
+
+        film_ids: Set[Any] = set()
+        for table, ids in ids_by_table.items():
+            if table in ("person", "genre"):
+                film_ids.update(self.tables[table][1]([{"id": id} for id in ids]))
+            else:
+                # Для film_work и связующих таблиц в уведомлении уже лежит ID фильма
+                film_ids.update(ids)
+
+        logger.info(
+            f"Получено уведомлений: {len(notifications)}, затронуто фильмов: {len(film_ids)}"
+        )
+        self.state_manager.notify(list(film_ids))
+        for table, ids in ids_by_table.items():
+            self.notified[NOTIFIED_SOURCES[table][0]].update(map(str, ids))
+
+    def clear_notified(self) -> None:
+        """Забывает строки, обработанные по уведомлениям."""
+        for keys in self.notified.values():
+            keys.clear()
+
+    def listen(self) -> None:
+        """Событийный режим: изменения приходят через LISTEN/NOTIFY.
+
+        Опрос таблиц по водяным знакам остается страховочной сверкой
+        и выполняется раз в reconcile_interval секунд. Сверка пропускает строки,
+        уже обработанные по уведомлениям, кроме случая потери соединения:
+        тогда уведомления могли пропасть, и проверяются все изменения.
+        """
+        self.es_client.create_index()
+        self.catch_up()
+        last_reconcile = time.monotonic()
+
+        for notifications in self.pg_client.listen_changes(
+            ETL_SETTINGS.pg_notify_channel,
+            window=ETL_SETTINGS.notify_window,
+            max_batch=ETL_SETTINGS.notify_max_batch,
+            idle_timeout=ETL_SETTINGS.reconcile_interval,
+        ):
+            if notifications:
+                self.process_notifications(notifications)
+            elif notifications is None:
+                self.clear_notified()
+
+            if not notifications or (
+                time.monotonic() - last_reconcile >= ETL_SETTINGS.reconcile_interval
+            ):
+                logger.info("Сверка изменений опросом таблиц")
+                self.catch_up()
+                self.clear_notified()
+                last_reconcile = time.monotonic()
 
     def mainloop(self) -> None:
+        self.es_client.create_index()
         while True:
-            for table in self.tables:
-                last_modified = self.last_modified_by_table[table]
+            self.catch_up()
+            time.sleep(ETL_SETTINGS.poll_interval)
 
-                logger.info(
-                    f"Обрабатываем таблицу: {table}, last_modified: {last_modified}"
-                )
 
-                now = datetime.datetime.now()
-                updated_ids = list(self.tables[table][0](last_modified))
+def reindex_shard(index: str, shard: Shard) -> Tuple[int, Dict[str, str]]:
+    """Процесс полной переиндексации одного шарда."""
+    main = Main()
+    try:
+        return main.reindex_range(index, shard.first_id, shard.last_id)
+    finally:
+        main.close()
+        main.pg_client.close()
+
 
-                if updated_ids and len(updated_ids) > 0:
-                    self.state_manager.change_state(now, updated_ids, table)
-                    self.last_modified_by_table[table] = now
-                    logger.info(f"Состояние обновлено для {table} до {now}")
-                else:
-                    logger.info(f"Нет обновлений для {table}")
+def prune_film_links_logs(pg_client: PostgresClient, shards: int) -> None:
+    """Чистит журналы связующих таблиц до наименьшего водяного знака среди шардов.
 
-            time.sleep(10)
+    Журналы читают все шарды, поэтому запись можно удалить, только когда
+    ее прочитал каждый из них.
+    """
+    state_managers = []
+    for number in range(shards):
+        storage = create_storage(Shard(number, shards).name)
+        try:
+            state_managers.append(StateManager(storage))
+        finally:
+            storage.close()
+
+    for table, link_table in FILM_LINK_LOGS.items():
+        watermark = min(state_manager.get_watermark(table) for state_manager in state_managers)
+        # Шард, еще не читавший журнал, не дает ничего удалить
+        if watermark[0] > datetime.datetime.min:
+            pg_client.delete_film_links_log(link_table, *watermark)
+
+
+def run_shard_worker(number: int = 0) -> None:
+    """Воркер инкрементального ETL, обрабатывающий арендованные шарды.
+
+    Аренда перераспределяется после каждого раунда и продлевается фоновым
+    потоком; перед сохранением водяных знаков Main проверяет, что шард
+    все еще арендован. Воркер, арендовавший шард 0, чистит журналы
+    связующих таблиц. Метрики воркера публикуются на порту metrics_port + number.
+    """
+    if ETL_SETTINGS.metrics_port:
+        metrics.start_metrics_server(ETL_SETTINGS.metrics_port + number)
+    pg_client = PostgresClient()
+    es_client = ElasticSearchClient()
+    leases = LeaseManager(pg_client, ETL_SETTINGS.shards, ETL_SETTINGS.lease_ttl)
+    coordinator = Shard(0, ETL_SETTINGS.shards)
+    mains: Dict[Shard, Main] = {}
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=leases.heartbeat, args=(stop,), name="lease-heartbeat", daemon=True
+    )
+    es_client.create_index()
+    heartbeat.start()
+    try:
+        while True:
+            owned = leases.rebalance()
+            for shard in set(mains) - owned:
+                mains.pop(shard).close()
+            for shard in sorted(owned - set(mains)):
+                mains[shard] = Main(shard, pg_client, es_client, leases)
+
+            for shard, main in sorted(mains.items()):
+                try:
+                    main.retry_dead_letters()
+                    while main.run_round():
+                        if shard not in leases.rebalance():
+                            break
+                except LeaseLostError:
+                    pass
+                if shard not in leases.renew():
+                    logger.warning(f"Аренда шарда {shard.name} потеряна")
+                    mains.pop(shard).close()
+
+            if ETL_SETTINGS.prune_film_links_log and coordinator in mains:
+                prune_film_links_logs(pg_client, ETL_SETTINGS.shards)
+
+            time.sleep(ETL_SETTINGS.poll_interval)
+    finally:
+        stop.set()
+        for main in mains.values():
+            main.close()
+        leases.release()
+        pg_client.close()
+
+
+def run_workers(workers: int) -> None:
+    """Запускает workers процессов-воркеров и ждет их завершения."""
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_shard_worker, args=(number,), name=f"etl-worker-{number}"
+        )
+        for number in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def parse_args() -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="ETL из PostgreSQL в Elasticsearch")
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="запустить асинхронный движок (asyncio)",
+    )
+    parser.add_argument(
+        "--listen",
+        action="store_true",
+        help="событийный режим на LISTEN/NOTIFY со сверкой опросом",
+    )
+    parser.add_argument(
+        "--full-reindex",
+        action="store_true",
+        help="переиндексировать все фильмы в новый индекс и переключить алиас",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="число процессов: воркеры с арендой шардов или процессы --full-reindex",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    Main().mainloop()
+    args = parse_args()
+    if args.workers <= 1 or args.full_reindex:
+        metrics.start_metrics_server(ETL_SETTINGS.metrics_port)
+    if args.full_reindex:
+        Main().full_reindex(args.workers)
+    elif args.workers > 1:
+        run_workers(args.workers)
+    elif args.listen:
+        Main().listen()
+    elif args.use_async:
+        from async_main import AsyncMain
+
+        asyncio.run(AsyncMain().mainloop())
+    else:
+        Main().mainloop()
@@ -0,0 +1,240 @@
+import abc
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from logging_config import logger
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Metric(abc.ABC):
+    """Базовая метрика с метками в текстовом формате Prometheus."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{value}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """Строки значений метрики без заголовков HELP и TYPE."""
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{self._format_labels(key)} {value}"
+                for key, value in self._values.items()
+            ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Счетчики корзин, затем сумма и количество наблюдений
+            values = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[position] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, values in self._values.items():
+                for bound, count in zip(self.buckets, values):
+                    labels = self._format_labels(key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = self._format_labels(key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {values[-1]}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {values[-2]}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {values[-1]}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+
+STAGE_SECONDS = Histogram(
+    "etl_stage_duration_seconds",
+    "Время этапа ETL (extract, transform, load) на одну пачку",
+    ["stage"],
+)
+STAGE_ROWS = Counter("etl_stage_rows_total", "Строк, прошедших через этап ETL", ["stage"])
+BULK_SECONDS = Histogram("etl_bulk_request_seconds", "Время ответа bulk API Elasticsearch")
+BULK_BYTES = Counter("etl_bulk_bytes_total", "Отправлено байт в bulk API")
+DOCUMENTS = Counter(
+    "etl_documents_total",
+    "Документы по результату загрузки (indexed, failed, skipped)",
+    ["result"],
+)
+RETRIES = Counter("etl_backoff_retries_total", "Повторы вызовов в backoff", ["function"])
+REPLICATION_LAG = Gauge(
+    "etl_replication_lag_seconds",
+    "Отставание водяного знака таблицы от текущего времени",
+    ["table"],
+)
+READ_HORIZON_LAG = Gauge(
+    "etl_read_horizon_lag_seconds",
+    "Отставание границы чтения изменений от текущего времени",
+)
+
+_stages = threading.local()
+
+
+def _enter(stage: str) -> None:
+    """Начинает отсчет времени этапа, приостанавливая объемлющий этап."""
+    stack = _stages.__dict__.setdefault("stack", [])
+    now = time.perf_counter()
+    if stack:
+        stack[-1][1] += now - stack[-1][2]
+    stack.append([stage, 0.0, now])
+
+
+def _exit() -> float:
+    """Заканчивает отсчет этапа и возвращает его собственное время."""
+    stack = _stages.stack
+    now = time.perf_counter()
+    _, elapsed, started = stack.pop()
+    if stack:
+        stack[-1][2] = now
+    return elapsed + now - started
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Замеряет собственное время этапа без времени вложенных этапов."""
+    _enter(name)
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(_exit(), stage=name)
+
+
+def timed(iterable: Iterable[Any], name: str) -> Iterator[Any]:
+    """Оборачивает генератор этапа: замеряет время получения элементов и считает строки.
+
+    Время вложенных этапов (например, выборки внутри преобразования)
+    в этап не включается.
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+    rows = 0
+    try:
+        while True:
+            _enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += _exit()
+            rows += 1
+            yield item
+    finally:
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        STAGE_ROWS.inc(rows, stage=name)
+
+
+def set_replication_lag(table: str, modified: Optional[datetime.datetime]) -> None:
+    """Обновляет отставание таблицы; None означает, что изменений не осталось."""
+    if modified is None:
+        REPLICATION_LAG.set(0, table=table)
+        return
+    if modified.tzinfo is None:
+        # Django пишет modified в UTC без часового пояса
+        modified = modified.replace(tzinfo=datetime.timezone.utc)
+    lag = datetime.datetime.now(datetime.timezone.utc) - modified
+    REPLICATION_LAG.set(max(lag.total_seconds(), 0), table=table)
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Запросы Prometheus не пишутся в лог ETL."""
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Запускает HTTP-эндпоинт /metrics в фоновом потоке; port=0 отключает его."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
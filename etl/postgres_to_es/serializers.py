@@ -0,0 +1,37 @@
+import json
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from logging_config import logger
+
+Serializer = Callable[[Any], bytes]
+
+
+def json_dumps(obj: Any) -> bytes:
+    """Сериализует объект в JSON стандартной библиотекой."""
+    return json.dumps(
+        obj, ensure_ascii=False, separators=(",", ":"), default=str
+    ).encode("utf-8")
+
+
+def orjson_dumps(obj: Any) -> bytes:
+    """Сериализует объект в JSON с помощью orjson."""
+    return orjson.dumps(obj, default=str)
+
+
+def get_serializer(name: str = "auto") -> Serializer:
+    """Возвращает функцию сериализации в bytes.
+
+    auto — orjson, если он установлен, иначе стандартный json.
+    """
+    if name == "json":
+        return json_dumps
+    if orjson is None:
+        if name == "orjson":
+            logger.warning("orjson не установлен, используется стандартный json")
+        return json_dumps
+    return orjson_dumps
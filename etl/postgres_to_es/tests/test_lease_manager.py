@@ -0,0 +1,75 @@
+"""Распределение шардов между воркерами через content.etl_worker и content.etl_lease.
+
+Нужна тестовая база с примененными миграциями (переменные SQL_* и POSTGRES_*,
+как у ETL); тест очищает таблицы аренды. Запуск из etl/postgres_to_es:
+
+    python -m unittest discover tests
+"""
+import unittest
+
+import psycopg
+
+from LeaseManager import LeaseManager
+from PostgresClient import PostgresClient
+
+SHARDS = 8
+TTL = 30
+
+
+class LeaseManagerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.pg_client = PostgresClient(use_pool=False)
+        try:
+            with cls.pg_client.connection() as conn:
+                conn.execute("SELECT 1 FROM content.etl_worker LIMIT 1;")
+        except psycopg.Error as e:
+            raise unittest.SkipTest(f"Нет тестовой базы: {e}")
+
+    def setUp(self) -> None:
+        with self.pg_client.connection() as conn:
+            with conn.transaction():
+                conn.execute("DELETE FROM content.etl_lease;")
+                conn.execute("DELETE FROM content.etl_worker;")
+        self.managers = [
+            LeaseManager(self.pg_client, SHARDS, TTL, owner=f"worker-{number}")
+            for number in range(3)
+        ]
+
+    def tearDown(self) -> None:
+        for manager in self.managers:
+            manager.release()
+
+    def rebalance(self, managers, rounds=3):
+        for _ in range(rounds):
+            owned = [manager.rebalance() for manager in managers]
+        return owned
+
+    def assert_spread(self, owned, sizes):
+        self.assertEqual(sorted(len(shards) for shards in owned), sizes)
+        self.assertEqual(len(set().union(*owned)), SHARDS)
+
+    def test_late_workers_get_shards(self) -> None:
+        first, *others = self.managers
+        self.assertEqual(len(first.rebalance()), SHARDS)
+        for manager in others:
+            manager.rebalance()
+
+        self.assert_spread(self.rebalance(self.managers), [2, 3, 3])
+
+    def test_released_shards_are_taken_over(self) -> None:
+        self.rebalance(self.managers)
+        self.managers[0].release()
+
+        self.assert_spread(self.rebalance(self.managers[1:]), [4, 4])
+
+    def test_renew_keeps_idle_worker_registered(self) -> None:
+        first, second, _ = self.managers
+        first.rebalance()
+        self.assertEqual(second.renew(), set())
+
+        self.assert_spread(self.rebalance([first, second]), [4, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
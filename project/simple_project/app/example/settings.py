@@ -112,4 +112,46 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Читать фильмы в Postgres из content.film_work_denorm вместо агрегации
+# по связующим таблицам (и в режиме postgres, и при откате с Elasticsearch)
+MOVIES_DENORM = os.getenv('MOVIES_DENORM', False) == 'True'
+
+# Источник данных API фильмов: postgres или elasticsearch (индекс ETL).
+# При недоступности Elasticsearch API отвечает из Postgres.
+MOVIES_READ_BACKEND = os.getenv('MOVIES_READ_BACKEND', 'postgres')
+
+ELASTICSEARCH = {
+    'HOST': os.getenv('ES_HOST', 'elasticsearch'),
+    'PORT': int(os.getenv('ES_PORT', 9200)),
+    'SCHEME': os.getenv('ES_SCHEME', 'http'),
+    'USER': os.getenv('ELASTIC_USER'),
+    'PASSWORD': os.getenv('ELASTIC_PASSWORD'),
+    'INDEX': os.getenv('ES_INDEX', 'movies'),
+    'TIMEOUT': float(os.getenv('ES_TIMEOUT', 2)),
+    # Сколько секунд не обращаться к Elasticsearch после ошибки
+    'RETRY_AFTER': float(os.getenv('ES_RETRY_AFTER', 30)),
+}
+
+# Кеш ответов API фильмов; для нескольких процессов uWSGI нужен общий
+# бэкенд (Redis, Memcached), LocMemCache у каждого процесса свой
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'movies': {
+        'BACKEND': os.getenv(
+            'MOVIES_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('MOVIES_CACHE_LOCATION', 'movies'),
+        'TIMEOUT': int(os.getenv('MOVIES_CACHE_TIMEOUT', 300)),
+    },
+}
+
+# Число процессов uWSGI: при нескольких процессах movies.checks требует
+# общий бэкенд кеша movies
+MOVIES_PROCESSES = int(os.getenv('UWSGI_PROCESSES') or 1)
+
+# Сколько секунд кешируется число фильмов в режиме курсорной пагинации
+MOVIES_COUNT_CACHE_TIMEOUT = int(os.getenv('MOVIES_COUNT_CACHE_TIMEOUT', 300))
+
 CORS_ALLOWED_ORIGINS = ["http://127.0.0.1:8080"]
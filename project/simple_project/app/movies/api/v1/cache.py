@@ -0,0 +1,99 @@
+"""Кеш ответов API фильмов с условными запросами.
+
+Ответ кешируется по пути и параметрам запроса в кеше 'movies'
+(LocMemCache по умолчанию, бэкенд задается в settings.CACHES).
+Ключ включает версию: общую для списков и отдельную для каждого фильма.
+Сигналы моделей (movies.signals) сбрасывают версии при изменении фильма,
+персоны, жанра или связи с ними, и старые записи больше не читаются.
+Сигналы срабатывают при коммите в Postgres, а Elasticsearch получает
+изменения позже, через ETL, поэтому с MOVIES_READ_BACKEND=elasticsearch
+ответы не кешируются (ETag и 304 при этом работают).
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+LIST_VERSION_KEY = 'movies:version:list'
+FILM_VERSION_KEY = 'movies:version:film:{id}'
+COUNT_VERSION_KEY = 'movies:version:count'
+
+
+def get_cache():
+    return caches['movies']
+
+
+def is_enabled():
+    return settings.MOVIES_READ_BACKEND != 'elasticsearch'
+
+
+def get_version(key):
+    """Версия записей кеша: время последнего сброса (или первого обращения)."""
+    return get_cache().get_or_set(key, time.time(), timeout=None)
+
+
+def invalidate(film_ids=(), count=False):
+    """Сбрасывает кешированные списки и карточки фильмов film_ids.
+
+    count=True сбрасывает и число фильмов курсорной пагинации
+    (фильм добавлен или удален).
+    """
+    keys = [LIST_VERSION_KEY, *(FILM_VERSION_KEY.format(id=film_id) for film_id in film_ids)]
+    if count:
+        keys.append(COUNT_VERSION_KEY)
+    get_cache().delete_many(keys)
+
+
+class CachedResponseMixin:
+    """Кеширует JSON-ответы GET и отвечает 304 на условные запросы.
+
+    Наследник задает get_version_key() и get_last_modified():
+    ETag считается по содержимому ответа, Last-Modified - по
+    FilmWork.modified и времени последнего сброса кеша.
+    """
+
+    def get_version_key(self):
+        raise NotImplementedError
+
+    def get_last_modified(self):
+        raise NotImplementedError
+
+    def get_cache_key(self, version):
+        query = urlencode(sorted(self.request.GET.lists()), doseq=True)
+        digest = hashlib.md5(f'{self.request.path}?{query}'.encode()).hexdigest()
+        return f'movies:response:{digest}:{version}'
+
+    def get(self, request, *args, **kwargs):
+        version = get_version(self.get_version_key())
+        key = self.get_cache_key(version)
+        entry = get_cache().get(key) if is_enabled() else None
+        if entry is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            last_modified = self.get_last_modified()
+            entry = {
+                'content': response.content,
+                'etag': '"%s"' % hashlib.md5(response.content).hexdigest(),
+                'last_modified': max(last_modified.timestamp(), version)
+                if last_modified else version,
+            }
+            if is_enabled():
+                get_cache().set(key, entry)
+
+        last_modified = int(entry['last_modified'])
+        response = get_conditional_response(
+            request, etag=entry['etag'], last_modified=last_modified
+        )
+        if response is None:
+            response = HttpResponse(entry['content'], content_type='application/json')
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(last_modified)
+        # Клиент может хранить ответ, но должен проверять его через ETag
+        patch_cache_control(response, no_cache=True)
+        return response
@@ -0,0 +1,113 @@
+"""Фильтры, сортировка и полнотекстовый поиск списка фильмов в Postgres.
+
+Параметры запроса:
+    genre            название жанра, можно несколько (фильм любого из них)
+    person           полное имя персоны в любой роли, можно несколько
+    type             movie или tv show
+    rating_min       рейтинг не ниже
+    rating_max       рейтинг не выше
+    date_from        дата создания не раньше (ГГГГ-ММ-ДД)
+    date_to          дата создания не позже
+    q                поиск по названию и описанию
+    sort             -creation_date (по умолчанию), creation_date, -rating, rating
+
+Жанры и персоны фильтруются подзапросом по связующим таблицам
+(индексы (genre_id, film_work_id) и (person_id, film_work_id)), чтобы
+не сужать агрегированные в ответе списки жанров и персон.
+"""
+import datetime
+import math
+
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.core.exceptions import BadRequest
+
+from movies.models import FilmTypes, FilmWork, GenreFilmWork, PersonFilmWork
+
+# Сортировка -> порядок в Postgres; id делает порядок однозначным
+SORTS = {
+    '-creation_date': ('-creation_date', '-id'),
+    'creation_date': ('creation_date', 'id'),
+    '-rating': ('-rating', '-id'),
+    'rating': ('rating', 'id'),
+}
+DEFAULT_SORT = '-creation_date'
+
+# Выражение должно совпадать с индексом film_work_search_idx (миграция 0010)
+SEARCH_CONFIG = 'english'
+SEARCH_VECTOR = SearchVector('title', 'description', config=SEARCH_CONFIG)
+
+
+def parse_value(params, name, parse):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return parse(value)
+    except ValueError:
+        raise BadRequest(f'Неверное значение параметра {name}: {value}')
+
+
+def parse_rating(value):
+    rating = float(value)
+    # float() принимает nan и inf, которые Postgres и Elasticsearch сравнивают по-разному
+    if not math.isfinite(rating):
+        raise ValueError(value)
+    return rating
+
+
+def parse_filters(params):
+    """Проверенные фильтры списка фильмов из параметров запроса."""
+    filters = {
+        'genres': sorted(set(params.getlist('genre'))),
+        'persons': sorted(set(params.getlist('person'))),
+        'type': params.get('type') or None,
+        'rating_min': parse_value(params, 'rating_min', parse_rating),
+        'rating_max': parse_value(params, 'rating_max', parse_rating),
+        'date_from': parse_value(params, 'date_from', datetime.date.fromisoformat),
+        'date_to': parse_value(params, 'date_to', datetime.date.fromisoformat),
+        'q': params.get('q', '').strip() or None,
+        'sort': params.get('sort') or DEFAULT_SORT,
+    }
+    if filters['type'] is not None and filters['type'] not in FilmTypes.values:
+        raise BadRequest(f'Неизвестный тип фильма: {filters["type"]}')
+    if filters['sort'] not in SORTS:
+        raise BadRequest(f'Неизвестная сортировка: {filters["sort"]}')
+    return filters
+
+
+def filter_queryset(queryset, filters):
+    """Применяет фильтры к выборке FilmWork или FilmWorkDenorm (без сортировки)."""
+    if filters['genres']:
+        queryset = queryset.filter(
+            id__in=GenreFilmWork.objects
+            .filter(genre__name__in=filters['genres'])
+            .values('film_work_id')
+        )
+    if filters['persons']:
+        queryset = queryset.filter(
+            id__in=PersonFilmWork.objects
+            .filter(person__full_name__in=filters['persons'])
+            .values('film_work_id')
+        )
+    if filters['type'] is not None:
+        queryset = queryset.filter(type=filters['type'])
+    if filters['rating_min'] is not None:
+        queryset = queryset.filter(rating__gte=filters['rating_min'])
+    if filters['rating_max'] is not None:
+        queryset = queryset.filter(rating__lte=filters['rating_max'])
+    if filters['date_from'] is not None:
+        queryset = queryset.filter(creation_date__gte=filters['date_from'])
+    if filters['date_to'] is not None:
+        queryset = queryset.filter(creation_date__lte=filters['date_to'])
+    if filters['q'] is not None:
+        queryset = queryset.filter(
+            id__in=FilmWork.objects
+            .alias(search=SEARCH_VECTOR)
+            .filter(search=SearchQuery(filters['q'], config=SEARCH_CONFIG, search_type='websearch'))
+            .values('id')
+        )
+    return queryset
+
+
+def sort_queryset(queryset, filters):
+    return queryset.order_by(*SORTS[filters['sort']])
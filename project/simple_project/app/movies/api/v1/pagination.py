@@ -0,0 +1,66 @@
+"""Курсорная пагинация списка фильмов.
+
+Курсор указывает на последний фильм страницы в порядке
+(creation_date DESC, id DESC), как у FilmWork.Meta.ordering с id для
+однозначности. Следующая страница выбирается условием "после курсора"
+по индексу film_work_creation_id_idx, поэтому ее стоимость не зависит
+от того, насколько далеко клиент пролистал каталог.
+"""
+import base64
+import datetime
+import hashlib
+import json
+import uuid
+
+from django.db.models import Q
+from django.http import Http404
+
+from movies.api.v1.cache import COUNT_VERSION_KEY, get_cache, get_version
+
+COUNT_CACHE_KEY = 'movies:count:{backend}:{version}:{filters}'
+
+
+def encode_cursor(movie):
+    """Непрозрачный курсор, указывающий на фильм."""
+    creation_date = movie['creation_date']
+    position = [str(creation_date) if creation_date else None, str(movie['id'])]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Позиция (creation_date, id) из курсора; пустой курсор означает начало списка."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        creation_date, movie_id = json.loads(raw)
+        return (
+            datetime.date.fromisoformat(creation_date) if creation_date else None,
+            uuid.UUID(movie_id),
+        )
+    except (AttributeError, TypeError, ValueError):
+        raise Http404('Неверный курсор')
+
+
+def after(position):
+    """Условие "строго после позиции" для порядка (-creation_date, -id).
+
+    В Postgres NULL при DESC идет первым: после фильма без даты идут
+    остальные фильмы без даты с меньшим id, затем все фильмы с датой.
+    """
+    creation_date, movie_id = position
+    if creation_date is None:
+        return Q(creation_date__isnull=False) | Q(creation_date__isnull=True, id__lt=movie_id)
+    # Отдельная граница creation_date <= ... дает условие для поиска по индексу
+    return Q(creation_date__lte=creation_date) & (
+        Q(creation_date__lt=creation_date) | Q(id__lt=movie_id)
+    )
+
+
+def cached_count(backend, filters, count, timeout):
+    """Число фильмов под фильтрами из кеша; count вызывается не чаще раза в timeout секунд."""
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()
+    key = COUNT_CACHE_KEY.format(
+        backend=backend, version=get_version(COUNT_VERSION_KEY), filters=digest
+    )
+    return get_cache().get_or_set(key, count, timeout)
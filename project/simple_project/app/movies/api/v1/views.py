@@ -1,11 +1,18 @@
+import math
+
+from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Q, Value
+from django.core.exceptions import BadRequest
+from django.db.models import F, Max, Q, Value
 from django.http import JsonResponse
 from django.views.generic.list import BaseListView
 from django.views.generic.detail import BaseDetailView
 from django.db.models.functions import Coalesce
 
-from movies.models import FilmWork
+from movies import search
+from movies.api.v1 import filtering, pagination
+from movies.api.v1.cache import FILM_VERSION_KEY, LIST_VERSION_KEY, CachedResponseMixin
+from movies.models import FilmWork, FilmWorkDenorm
 
 
 class MoviesApiMixin:
@@ -13,6 +20,14 @@ class MoviesApiMixin:
     http_method_names = ["get"]
 
     def get_queryset(self):
+        if settings.MOVIES_DENORM:
+            # Жанры и персоны уже собраны триггерами в content.film_work_denorm
+            return FilmWorkDenorm.objects.values(
+                "id", "title", "description", "creation_date", "rating", "type", "genres",
+                actors=F("actors_names"),
+                directors=F("directors_names"),
+                writers=F("writers_names"),
+            )
         return (
             FilmWork.objects
             .values("id", "title", "description", "creation_date", "rating", "type")
@@ -49,11 +64,31 @@ class MoviesApiMixin:
         return JsonResponse(context)
 
 
-class MoviesListApi(MoviesApiMixin, BaseListView):
+class MoviesListApi(CachedResponseMixin, MoviesApiMixin, BaseListView):
     paginate_by = 50
 
+    def get_version_key(self):
+        return LIST_VERSION_KEY
+
+    def get_last_modified(self):
+        return FilmWork.objects.aggregate(last_modified=Max("modified"))["last_modified"]
+
     def get_context_data(self, *, object_list=None, **kwargs):
-        queryset = self.get_queryset()
+        filters = filtering.parse_filters(self.request.GET)
+        cursor = self.request.GET.get("cursor")
+        if cursor is not None:
+            if filters["sort"] != filtering.DEFAULT_SORT:
+                raise BadRequest("Курсорная пагинация доступна только с сортировкой по умолчанию")
+            return self.paginate_cursor(pagination.decode_cursor(cursor), filters)
+        if search.is_enabled():
+            try:
+                return self.paginate(search.MovieSearchResults(filters))
+            except search.SEARCH_ERRORS as error:
+                search.mark_failed(error)
+        queryset = filtering.filter_queryset(self.get_queryset(), filters)
+        return self.paginate(filtering.sort_queryset(queryset, filters))
+
+    def paginate(self, queryset):
         paginator, page, queryset, is_paginated = self.paginate_queryset(queryset, self.paginate_by)
         context = {
             "count": paginator.count,
@@ -64,8 +99,82 @@ class MoviesListApi(MoviesApiMixin, BaseListView):
         }
         return context
 
+    def paginate_cursor(self, position, filters):
+        """Страница после курсора; count и total_pages берутся из кеша."""
+        movies = None
+        if search.is_enabled():
+            try:
+                movies = search.search_after(position, self.paginate_by + 1, filters)
+                count = pagination.cached_count(
+                    "elasticsearch",
+                    filters,
+                    lambda: search.count(filters),
+                    settings.MOVIES_COUNT_CACHE_TIMEOUT,
+                )
+            except search.SEARCH_ERRORS as error:
+                search.mark_failed(error)
+                movies = None
+        if movies is None:
+            movies = self.get_page_after(position, self.paginate_by + 1, filters)
+            count = pagination.cached_count(
+                "postgres",
+                filters,
+                filtering.filter_queryset(FilmWork.objects.all(), filters).count,
+                settings.MOVIES_COUNT_CACHE_TIMEOUT,
+            )
+
+        has_next = len(movies) > self.paginate_by
+        movies = movies[:self.paginate_by]
+        context = {
+            "count": count,
+            "total_pages": max(math.ceil(count / self.paginate_by), 1),
+            "prev": None,
+            "next": pagination.encode_cursor(movies[-1]) if has_next else None,
+            "results": movies,
+        }
+        return context
+
+    def get_page_after(self, position, size, filters):
+        """Фильмы после позиции курсора из Postgres.
+
+        Сначала по индексу выбираются id страницы, и только для них
+        агрегируются жанры и персоны. Фильм, строки которого еще нет
+        в film_work_denorm, пропускается.
+        """
+        page = filtering.sort_queryset(
+            filtering.filter_queryset(FilmWork.objects.all(), filters), filters
+        )
+        if position is not None:
+            page = page.filter(pagination.after(position))
+        ids = list(page.values_list("id", flat=True)[:size])
+        movies = {movie["id"]: movie for movie in self.get_queryset().filter(id__in=ids)}
+        return [movies[movie_id] for movie_id in ids if movie_id in movies]
+
+
+class MoviesDetailApi(CachedResponseMixin, MoviesApiMixin, BaseDetailView):
+
+    def get_version_key(self):
+        return FILM_VERSION_KEY.format(id=self.kwargs[self.pk_url_kwarg])
+
+    def get_last_modified(self):
+        return (
+            FilmWork.objects
+            .filter(pk=self.kwargs[self.pk_url_kwarg])
+            .values_list("modified", flat=True)
+            .first()
+        )
 
-class MoviesDetailApi(MoviesApiMixin, BaseDetailView):
+    def get_object(self, queryset=None):
+        if search.is_enabled():
+            try:
+                movie = search.get_movie(self.kwargs[self.pk_url_kwarg])
+            except search.SEARCH_ERRORS as error:
+                search.mark_failed(error)
+            else:
+                # Фильма может еще не быть в индексе, тогда его найдет Postgres
+                if movie is not None:
+                    return movie
+        return super().get_object(queryset)
 
     def get_context_data(self, **kwargs):
-        return self.get_object()
+        return self.object
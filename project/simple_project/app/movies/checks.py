@@ -0,0 +1,20 @@
+"""Системные проверки настроек приложения movies (manage.py check, migrate)."""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches)
+def check_movies_cache(app_configs, **kwargs):
+    """LocMemCache у каждого процесса свой: сигналы сбросили бы кеш только в одном."""
+    if settings.MOVIES_PROCESSES > 1 and settings.CACHES['movies']['BACKEND'] == LOCMEM_CACHE:
+        return [
+            Error(
+                'Кеш movies не может быть LocMemCache при нескольких процессах uWSGI.',
+                hint='Задайте общий бэкенд в MOVIES_CACHE_BACKEND и MOVIES_CACHE_LOCATION, '
+                'например django.core.cache.backends.redis.RedisCache.',
+                id='movies.E001',
+            )
+        ]
+    return []
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from movies.models import FilmWork
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает content.film_work_denorm для всех фильмов. '
+        'Обычно таблицу обновляют триггеры; команда нужна после изменений '
+        'в обход них (например, session_replication_role = replica).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        films = FilmWork.objects.order_by('id').values_list('id', flat=True)
+        refreshed = 0
+        last_id = None
+        while True:
+            page = films.filter(id__gt=last_id) if last_id else films
+            ids = list(page[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('SELECT content.refresh_film_work_denorm(%s::uuid[])', [ids])
+            refreshed += len(ids)
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Обновлено фильмов: {refreshed}'))
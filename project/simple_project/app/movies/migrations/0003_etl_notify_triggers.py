@@ -0,0 +1,61 @@
+from django.db import migrations
+
+CHANNEL = 'etl_changes'
+
+# Таблица и колонка, ID из которой отправляется в уведомлении.
+# Для связующих таблиц отправляется ID фильма, документ которого изменился.
+TRIGGER_TABLES = (
+    ('film_work', 'id'),
+    ('person', 'id'),
+    ('genre', 'id'),
+    ('person_film_work', 'film_work_id'),
+    ('genre_film_work', 'film_work_id'),
+)
+
+CREATE_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION content.etl_notify_change() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify(
+        '{CHANNEL}',
+        json_build_object('table', TG_TABLE_NAME, 'id', row_data ->> TG_ARGV[0])::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTION = 'DROP FUNCTION IF EXISTS content.etl_notify_change();'
+
+
+def create_trigger(table, column):
+    return (
+        f'CREATE TRIGGER {table}_etl_notify '
+        f'AFTER INSERT OR UPDATE OR DELETE ON content.{table} '
+        f"FOR EACH ROW EXECUTE FUNCTION content.etl_notify_change('{column}');"
+    )
+
+
+def drop_trigger(table):
+    return f'DROP TRIGGER IF EXISTS {table}_etl_notify ON content.{table};'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_alter_personfilmwork_role'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_FUNCTION, reverse_sql=DROP_FUNCTION),
+        *[
+            migrations.RunSQL(sql=create_trigger(table, column), reverse_sql=drop_trigger(table))
+            for table, column in TRIGGER_TABLES
+        ],
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# Журналы изменений связующих таблиц. Строки добавляются триггерами,
+# ETL читает их по (modified, id) так же, как film_work, person и genre.
+LINK_TABLES = ('person_film_work', 'genre_film_work')
+
+CREATE_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.etl_log_film_work_link() RETURNS trigger AS $$
+DECLARE
+    log_insert text := format(
+        'INSERT INTO content.%I (film_work_id) VALUES ($1)', TG_TABLE_NAME || '_log'
+    );
+BEGIN
+    IF TG_OP = 'DELETE'
+        OR (TG_OP = 'UPDATE' AND OLD.film_work_id IS DISTINCT FROM NEW.film_work_id)
+    THEN
+        EXECUTE log_insert USING OLD.film_work_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        EXECUTE log_insert USING NEW.film_work_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTION = 'DROP FUNCTION IF EXISTS content.etl_log_film_work_link();'
+
+
+def create_log(table):
+    return f"""
+        CREATE TABLE content.{table}_log (
+            id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+            film_work_id uuid NOT NULL,
+            modified timestamp NOT NULL DEFAULT timezone('utc', now())
+        );
+        CREATE INDEX {table}_log_modified_idx ON content.{table}_log (modified, id);
+        CREATE TRIGGER {table}_etl_log
+            AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+            FOR EACH ROW EXECUTE FUNCTION content.etl_log_film_work_link();
+    """
+
+
+def drop_log(table):
+    return f"""
+        DROP TRIGGER IF EXISTS {table}_etl_log ON content.{table};
+        DROP TABLE IF EXISTS content.{table}_log;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_etl_notify_triggers'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_FUNCTION, reverse_sql=DROP_FUNCTION),
+        *[
+            migrations.RunSQL(sql=create_log(table), reverse_sql=drop_log(table))
+            for table in LINK_TABLES
+        ],
+    ]
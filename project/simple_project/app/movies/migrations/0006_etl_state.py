@@ -0,0 +1,23 @@
+from django.db import migrations
+
+# Состояние ETL (водяные знаки таблиц) при STATE_STORAGE=postgres.
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS content.etl_state (
+    key text PRIMARY KEY,
+    value jsonb NOT NULL,
+    modified timestamp with time zone NOT NULL DEFAULT now()
+);
+"""
+
+DROP_TABLE = 'DROP TABLE IF EXISTS content.etl_state;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_etl_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_TABLE, reverse_sql=DROP_TABLE),
+    ]
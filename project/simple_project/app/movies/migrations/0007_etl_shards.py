@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Шардовые воркеры ETL: состояние каждого шарда хранится в своем namespace,
+# а шарды распределяются между воркерами арендой в etl_lease.
+NAMESPACE_STATE = """
+ALTER TABLE content.etl_state ADD COLUMN namespace text NOT NULL DEFAULT '';
+ALTER TABLE content.etl_state DROP CONSTRAINT etl_state_pkey;
+ALTER TABLE content.etl_state ADD PRIMARY KEY (namespace, key);
+"""
+
+UNNAMESPACE_STATE = """
+DELETE FROM content.etl_state WHERE namespace <> '';
+ALTER TABLE content.etl_state DROP CONSTRAINT etl_state_pkey;
+ALTER TABLE content.etl_state ADD PRIMARY KEY (key);
+ALTER TABLE content.etl_state DROP COLUMN namespace;
+"""
+
+CREATE_LEASE = """
+CREATE TABLE IF NOT EXISTS content.etl_lease (
+    shard integer PRIMARY KEY,
+    owner text,
+    expires_at timestamp with time zone
+);
+"""
+
+DROP_LEASE = 'DROP TABLE IF EXISTS content.etl_lease;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_etl_state'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=NAMESPACE_STATE, reverse_sql=UNNAMESPACE_STATE),
+        migrations.RunSQL(sql=CREATE_LEASE, reverse_sql=DROP_LEASE),
+    ]
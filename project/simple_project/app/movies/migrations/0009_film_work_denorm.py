@@ -0,0 +1,240 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+# Фильм с жанрами и персонами по ролям одной строкой. Таблицу обновляет
+# content.refresh_film_work_denorm(ids) из триггеров уровня оператора:
+# по одному вызову на оператор, с ID всех затронутых фильмов.
+CREATE_TABLE = """
+CREATE TABLE content.film_work_denorm (
+    id uuid PRIMARY KEY REFERENCES content.film_work (id) ON DELETE CASCADE,
+    title text,
+    description text,
+    creation_date date,
+    rating double precision,
+    type text,
+    genres text[] NOT NULL DEFAULT '{}',
+    directors_people jsonb NOT NULL DEFAULT '[]',
+    actors_people jsonb NOT NULL DEFAULT '[]',
+    writers_people jsonb NOT NULL DEFAULT '[]',
+    directors_names text[] NOT NULL DEFAULT '{}',
+    actors_names text[] NOT NULL DEFAULT '{}',
+    writers_names text[] NOT NULL DEFAULT '{}',
+    modified timestamp with time zone NOT NULL DEFAULT now()
+);
+CREATE INDEX film_work_denorm_creation_id_idx
+    ON content.film_work_denorm (creation_date, id);
+"""
+
+DROP_TABLE = 'DROP TABLE IF EXISTS content.film_work_denorm;'
+
+# Порядок как у документов ETL: жанры по имени (побайтно), персоны по id.
+# *_names - отсортированные уникальные имена, как ArrayAgg(distinct=True) в API.
+CREATE_REFRESH_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.refresh_film_work_denorm(film_ids uuid[])
+RETURNS void AS $$
+    INSERT INTO content.film_work_denorm AS d (
+        id, title, description, creation_date, rating, type, genres,
+        directors_people, actors_people, writers_people,
+        directors_names, actors_names, writers_names
+    )
+    SELECT
+        fw.id,
+        fw.title,
+        fw.description,
+        fw.creation_date,
+        fw.rating,
+        fw.type,
+        COALESCE(g.genres, '{}'),
+        COALESCE(p.directors, '[]'),
+        COALESCE(p.actors, '[]'),
+        COALESCE(p.writers, '[]'),
+        COALESCE(p.directors_names, '{}'),
+        COALESCE(p.actors_names, '{}'),
+        COALESCE(p.writers_names, '{}')
+    FROM content.film_work fw
+    LEFT JOIN LATERAL (
+        SELECT array_agg(DISTINCT g.name COLLATE "C" ORDER BY g.name COLLATE "C") AS genres
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ) g ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'director') AS directors,
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'actor') AS actors,
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'writer') AS writers,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director')
+                AS directors_names,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors_names,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers_names
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id
+    ) p ON TRUE
+    WHERE fw.id = ANY(film_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        creation_date = EXCLUDED.creation_date,
+        rating = EXCLUDED.rating,
+        type = EXCLUDED.type,
+        genres = EXCLUDED.genres,
+        directors_people = EXCLUDED.directors_people,
+        actors_people = EXCLUDED.actors_people,
+        writers_people = EXCLUDED.writers_people,
+        directors_names = EXCLUDED.directors_names,
+        actors_names = EXCLUDED.actors_names,
+        writers_names = EXCLUDED.writers_names,
+        modified = now();
+$$ LANGUAGE sql;
+"""
+
+DROP_REFRESH_FUNCTION = 'DROP FUNCTION IF EXISTS content.refresh_film_work_denorm(uuid[]);'
+
+# Триггерная функция: TG_ARGV[0] - запрос, который по переходным таблицам
+# old_rows/new_rows возвращает ID затронутых фильмов
+CREATE_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.film_work_denorm_refresh_trigger() RETURNS trigger AS $$
+DECLARE
+    film_ids uuid[];
+BEGIN
+    EXECUTE TG_ARGV[0] INTO film_ids;
+    IF film_ids IS NOT NULL THEN
+        PERFORM content.refresh_film_work_denorm(film_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_TRIGGER_FUNCTION = 'DROP FUNCTION IF EXISTS content.film_work_denorm_refresh_trigger();'
+
+# Таблица -> запрос ID фильмов по строкам из переходной таблицы {rows}.
+# Удаление фильма убирает его строку каскадом, удаление персоны или жанра
+# сначала удаляет их связи с фильмами (on_delete=CASCADE в Django).
+FILM_IDS_QUERIES = {
+    'film_work': 'SELECT array_agg(id) FROM {rows}',
+    'person_film_work': 'SELECT array_agg(DISTINCT film_work_id) FROM {rows}',
+    'genre_film_work': 'SELECT array_agg(DISTINCT film_work_id) FROM {rows}',
+    'person': (
+        'SELECT array_agg(DISTINCT pfw.film_work_id) FROM content.person_film_work pfw '
+        'WHERE pfw.person_id IN (SELECT id FROM {rows})'
+    ),
+    'genre': (
+        'SELECT array_agg(DISTINCT gfw.film_work_id) FROM content.genre_film_work gfw '
+        'WHERE gfw.genre_id IN (SELECT id FROM {rows})'
+    ),
+}
+
+# Событие -> переходные таблицы, доступные триггеру, и таблица, по которой
+# ищутся фильмы. Для UPDATE связи старые и новые фильмы разные, поэтому
+# берутся обе версии строк.
+EVENTS = {
+    'INSERT': ('REFERENCING NEW TABLE AS new_rows', 'new_rows'),
+    'UPDATE': (
+        'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+        '(SELECT * FROM old_rows UNION ALL SELECT * FROM new_rows) AS changed_rows',
+    ),
+    'DELETE': ('REFERENCING OLD TABLE AS old_rows', 'old_rows'),
+}
+
+# Для фильмов, персон и жанров важны только вставка и изменение
+TABLE_EVENTS = {
+    'film_work': ('INSERT', 'UPDATE'),
+    'person': ('UPDATE',),
+    'genre': ('UPDATE',),
+    'person_film_work': ('INSERT', 'UPDATE', 'DELETE'),
+    'genre_film_work': ('INSERT', 'UPDATE', 'DELETE'),
+}
+
+
+def quote_literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def create_trigger(table, event):
+    referencing, rows = EVENTS[event]
+    query = FILM_IDS_QUERIES[table].format(rows=rows)
+    return (
+        f'CREATE TRIGGER {table}_denorm_{event.lower()} '
+        f'AFTER {event} ON content.{table} {referencing} '
+        f'FOR EACH STATEMENT EXECUTE FUNCTION '
+        f'content.film_work_denorm_refresh_trigger({quote_literal(query)});'
+    )
+
+
+def drop_trigger(table, event):
+    return f'DROP TRIGGER IF EXISTS {table}_denorm_{event.lower()} ON content.{table};'
+
+
+FILL_TABLE = """
+SELECT content.refresh_film_work_denorm(array_agg(id)) FROM content.film_work;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_film_work_creation_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_TABLE, reverse_sql=DROP_TABLE),
+        migrations.RunSQL(sql=CREATE_REFRESH_FUNCTION, reverse_sql=DROP_REFRESH_FUNCTION),
+        migrations.RunSQL(sql=CREATE_TRIGGER_FUNCTION, reverse_sql=DROP_TRIGGER_FUNCTION),
+        *[
+            migrations.RunSQL(
+                sql=create_trigger(table, event), reverse_sql=drop_trigger(table, event)
+            )
+            for table, events in TABLE_EVENTS.items()
+            for event in events
+        ],
+        migrations.RunSQL(sql=FILL_TABLE, reverse_sql=migrations.RunSQL.noop),
+        migrations.CreateModel(
+            name='FilmWorkDenorm',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('title', models.TextField(null=True)),
+                ('description', models.TextField(null=True)),
+                ('creation_date', models.DateField(null=True)),
+                ('rating', models.FloatField(null=True)),
+                ('type', models.TextField(null=True)),
+                (
+                    'genres',
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), size=None
+                    ),
+                ),
+                ('directors_people', models.JSONField()),
+                ('actors_people', models.JSONField()),
+                ('writers_people', models.JSONField()),
+                (
+                    'directors_names',
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), size=None
+                    ),
+                ),
+                (
+                    'actors_names',
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), size=None
+                    ),
+                ),
+                (
+                    'writers_names',
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), size=None
+                    ),
+                ),
+                ('modified', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'content"."film_work_denorm',
+                'ordering': ['-creation_date'],
+                'managed': False,
+            },
+        ),
+    ]
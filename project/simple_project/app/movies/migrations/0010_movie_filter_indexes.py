@@ -0,0 +1,33 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('movies', '0009_film_work_denorm'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=models.Index(fields=['rating', 'id'], name='film_work_rating_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    'title', 'description', config='english'
+                ),
+                name='film_work_search_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='person',
+            index=models.Index(fields=['full_name'], name='person_full_name_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# now() - время начала транзакции: строка журнала долгой транзакции
+# становится видна позже строк с большим modified, и ETL, уже прошедший
+# это время, ее бы не прочитал. clock_timestamp() - время самой вставки,
+# не раньше начала транзакции, поэтому ETL читает журнал только до начала
+# самой старой активной транзакции (PostgresClient.get_updated_film_links).
+LINK_TABLES = ('person_film_work', 'genre_film_work')
+
+
+def set_default(table, value):
+    return (
+        f'ALTER TABLE content.{table}_log '
+        f"ALTER COLUMN modified SET DEFAULT timezone('utc', {value});"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_movie_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=set_default(table, 'clock_timestamp()'),
+            reverse_sql=set_default(table, 'now()'),
+        )
+        for table in LINK_TABLES
+    ]
@@ -0,0 +1,155 @@
+from django.db import migrations
+
+# В READ COMMITTED две транзакции, меняющие связи одного фильма, не видят
+# изменений друг друга, и последний upsert записал бы строку без чужой связи.
+# Поэтому функция сначала блокирует фильмы (в порядке id, чтобы не было
+# взаимоблокировок), а пересобирает их отдельным оператором - со свежим
+# снимком, где видны связи транзакции, освободившей блокировку.
+# FOR NO KEY UPDATE, а не FOR UPDATE: он не конфликтует с FOR KEY SHARE,
+# который вставка связи держит на фильме по внешнему ключу.
+CREATE_REFRESH_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.refresh_film_work_denorm(film_ids uuid[])
+RETURNS void AS $$
+BEGIN
+    PERFORM 1 FROM content.film_work
+    WHERE id = ANY(film_ids)
+    ORDER BY id
+    FOR NO KEY UPDATE;
+
+    INSERT INTO content.film_work_denorm AS d (
+        id, title, description, creation_date, rating, type, genres,
+        directors_people, actors_people, writers_people,
+        directors_names, actors_names, writers_names
+    )
+    SELECT
+        fw.id,
+        fw.title,
+        fw.description,
+        fw.creation_date,
+        fw.rating,
+        fw.type,
+        COALESCE(g.genres, '{}'),
+        COALESCE(p.directors, '[]'),
+        COALESCE(p.actors, '[]'),
+        COALESCE(p.writers, '[]'),
+        COALESCE(p.directors_names, '{}'),
+        COALESCE(p.actors_names, '{}'),
+        COALESCE(p.writers_names, '{}')
+    FROM content.film_work fw
+    LEFT JOIN LATERAL (
+        SELECT array_agg(DISTINCT g.name COLLATE "C" ORDER BY g.name COLLATE "C") AS genres
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ) g ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'director') AS directors,
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'actor') AS actors,
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'writer') AS writers,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director')
+                AS directors_names,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors_names,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers_names
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id
+    ) p ON TRUE
+    WHERE fw.id = ANY(film_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        creation_date = EXCLUDED.creation_date,
+        rating = EXCLUDED.rating,
+        type = EXCLUDED.type,
+        genres = EXCLUDED.genres,
+        directors_people = EXCLUDED.directors_people,
+        actors_people = EXCLUDED.actors_people,
+        writers_people = EXCLUDED.writers_people,
+        directors_names = EXCLUDED.directors_names,
+        actors_names = EXCLUDED.actors_names,
+        writers_names = EXCLUDED.writers_names,
+        modified = now();
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Функция из 0009 без блокировки
+CREATE_UNLOCKED_REFRESH_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.refresh_film_work_denorm(film_ids uuid[])
+RETURNS void AS $$
+    INSERT INTO content.film_work_denorm AS d (
+        id, title, description, creation_date, rating, type, genres,
+        directors_people, actors_people, writers_people,
+        directors_names, actors_names, writers_names
+    )
+    SELECT
+        fw.id,
+        fw.title,
+        fw.description,
+        fw.creation_date,
+        fw.rating,
+        fw.type,
+        COALESCE(g.genres, '{}'),
+        COALESCE(p.directors, '[]'),
+        COALESCE(p.actors, '[]'),
+        COALESCE(p.writers, '[]'),
+        COALESCE(p.directors_names, '{}'),
+        COALESCE(p.actors_names, '{}'),
+        COALESCE(p.writers_names, '{}')
+    FROM content.film_work fw
+    LEFT JOIN LATERAL (
+        SELECT array_agg(DISTINCT g.name COLLATE "C" ORDER BY g.name COLLATE "C") AS genres
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ) g ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'director') AS directors,
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'actor') AS actors,
+            jsonb_agg(jsonb_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.id)
+                FILTER (WHERE pfw.role = 'writer') AS writers,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director')
+                AS directors_names,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors_names,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers_names
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id
+    ) p ON TRUE
+    WHERE fw.id = ANY(film_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        creation_date = EXCLUDED.creation_date,
+        rating = EXCLUDED.rating,
+        type = EXCLUDED.type,
+        genres = EXCLUDED.genres,
+        directors_people = EXCLUDED.directors_people,
+        actors_people = EXCLUDED.actors_people,
+        writers_people = EXCLUDED.writers_people,
+        directors_names = EXCLUDED.directors_names,
+        actors_names = EXCLUDED.actors_names,
+        writers_names = EXCLUDED.writers_names,
+        modified = now();
+$$ LANGUAGE sql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_film_work_link_log_clock'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_REFRESH_FUNCTION, reverse_sql=CREATE_UNLOCKED_REFRESH_FUNCTION
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+# Живые воркеры ETL. Доля шардов считается по этой таблице, а не по
+# владельцам аренды: воркер без шардов тоже должен быть виден остальным.
+CREATE_WORKER = """
+CREATE TABLE IF NOT EXISTS content.etl_worker (
+    owner text PRIMARY KEY,
+    expires_at timestamp with time zone NOT NULL
+);
+"""
+
+DROP_WORKER = 'DROP TABLE IF EXISTS content.etl_worker;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_film_work_denorm_lock'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_WORKER, reverse_sql=DROP_WORKER),
+    ]
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 import uuid
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -33,6 +36,9 @@ class Genre(UUIDMixin, TimeStampedMixin):
         verbose_name = _('genre')
         verbose_name_plural = _('genres')
         ordering = ('name',)
+        indexes = [
+            models.Index(fields=['modified', 'id'], name='genre_modified_id_idx'),
+        ]
 
 
 class Person(UUIDMixin, TimeStampedMixin):
@@ -45,6 +51,10 @@ class Person(UUIDMixin, TimeStampedMixin):
         db_table = 'content"."person'
         verbose_name = _('person')
         verbose_name_plural = _('persons')
+        indexes = [
+            models.Index(fields=['modified', 'id'], name='person_modified_id_idx'),
+            models.Index(fields=['full_name'], name='person_full_name_idx'),
+        ]
 
 
 class FilmTypes(models.TextChoices):
@@ -90,6 +100,13 @@ class FilmWork(UUIDMixin, TimeStampedMixin):
                 fields=['creation_date', 'rating'],
                 name='film_work_creation_rating_idx',
             ),
+            models.Index(fields=['creation_date', 'id'], name='film_work_creation_id_idx'),
+            models.Index(fields=['rating', 'id'], name='film_work_rating_id_idx'),
+            GinIndex(
+                SearchVector('title', 'description', config='english'),
+                name='film_work_search_idx',
+            ),
+            models.Index(fields=['modified', 'id'], name='film_work_modified_id_idx'),
         ]
 
 
@@ -115,6 +132,9 @@ class GenreFilmWork(UUIDMixin):
                 name='film_work_genre_idx',
             ),
         ]
+        indexes = [
+            models.Index(fields=['genre', 'film_work'], name='genre_film_work_genre_idx'),
+        ]
 
 
 class Roles(models.TextChoices):
@@ -151,3 +171,33 @@ class PersonFilmWork(UUIDMixin):
                 name='film_work_person_role_idx',
             ),
         ]
+        indexes = [
+            models.Index(fields=['person', 'film_work'], name='person_film_work_person_idx'),
+        ]
+
+
+class FilmWorkDenorm(models.Model):
+    """Фильм с жанрами и персонами по ролям одной строкой.
+
+    Таблицу content.film_work_denorm поддерживают триггеры
+    (миграция 0009), модель используется только для чтения.
+    """
+    id = models.UUIDField(primary_key=True)
+    title = models.TextField(null=True)
+    description = models.TextField(null=True)
+    creation_date = models.DateField(null=True)
+    rating = models.FloatField(null=True)
+    type = models.TextField(null=True)
+    genres = ArrayField(models.TextField())
+    directors_people = models.JSONField()
+    actors_people = models.JSONField()
+    writers_people = models.JSONField()
+    directors_names = ArrayField(models.TextField())
+    actors_names = ArrayField(models.TextField())
+    writers_names = ArrayField(models.TextField())
+    modified = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'content"."film_work_denorm'
+        ordering = ['-creation_date']
@@ -0,0 +1,223 @@
+"""Чтение фильмов из индекса Elasticsearch, который заполняет ETL.
+
+Документы индекса уже содержат жанры и персоны по ролям, поэтому
+список и карточка фильма получаются без агрегации в Postgres.
+Ответ приводится к тому же виду, что и MoviesApiMixin.get_queryset.
+"""
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from elasticsearch import ApiError, Elasticsearch, NotFoundError, TransportError
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, при которых API отвечает из Postgres
+SEARCH_ERRORS = (ApiError, TransportError)
+
+# Поле сортировки API -> поле индекса
+SORT_FIELDS = {'creation_date': 'creation_date', 'rating': 'imdb_rating'}
+
+# Роли, по именам которых ищется персона
+ROLES = ('directors', 'actors', 'writers')
+
+# Значение сортировки, которое Elasticsearch подставляет вместо отсутствующей
+# даты при order=desc и missing=_first (порядок курсорной пагинации)
+MISSING_DATE = 2 ** 63 - 1
+
+_client = None
+_retry_at = 0.0
+
+
+def is_enabled():
+    """Включено ли чтение из Elasticsearch и не было ли недавней ошибки."""
+    return (
+        settings.MOVIES_READ_BACKEND == 'elasticsearch'
+        and time.monotonic() >= _retry_at
+    )
+
+
+def mark_failed(error):
+    """Фиксирует ошибку Elasticsearch, после которой запрос обслужит Postgres.
+
+    Если Elasticsearch недоступен (сеть, таймаут, ошибка 5xx), чтение из него
+    отключается на ELASTICSEARCH['RETRY_AFTER'] секунд, чтобы запросы не ждали
+    таймаута. Ошибка конкретного запроса (например, страница дальше
+    max_result_window) на остальные запросы не влияет.
+    """
+    global _retry_at
+    if isinstance(error, TransportError) or error.meta.status >= 500:
+        _retry_at = time.monotonic() + settings.ELASTICSEARCH['RETRY_AFTER']
+    logger.warning('Ошибка Elasticsearch, фильмы читаются из Postgres: %s', error)
+
+
+def get_client():
+    """Клиент Elasticsearch, один на процесс."""
+    global _client
+    if _client is None:
+        config = settings.ELASTICSEARCH
+        _client = Elasticsearch(
+            hosts=[{'host': config['HOST'], 'port': config['PORT'], 'scheme': config['SCHEME']}],
+            basic_auth=(config['USER'], config['PASSWORD']) if config['USER'] else None,
+            request_timeout=config['TIMEOUT'],
+            max_retries=0,
+        )
+    return _client
+
+
+def to_movie(source):
+    """Документ индекса в формате ответа API."""
+    return {
+        'id': source['id'],
+        'title': source['title'],
+        'description': source['description'],
+        'creation_date': source.get('creation_date'),
+        'rating': source['imdb_rating'],
+        'type': source.get('type'),
+        'genres': sorted(source['genres']),
+        'actors': sorted(set(source['actors_names'])),
+        'directors': sorted(set(source['directors_names'])),
+        'writers': sorted(set(source['writers_names'])),
+    }
+
+
+def build_sort(sort):
+    """Сортировка API (-creation_date, rating, ...) в сортировку Elasticsearch.
+
+    Фильмы без значения идут первыми при убывании и последними
+    при возрастании, как NULL в Postgres; id делает порядок однозначным.
+    """
+    order = 'desc' if sort.startswith('-') else 'asc'
+    return [
+        {
+            SORT_FIELDS[sort.lstrip('-')]: {
+                'order': order,
+                'missing': '_first' if order == 'desc' else '_last',
+            }
+        },
+        {'id': {'order': order}},
+    ]
+
+
+def build_query(filters):
+    """Фильтры списка фильмов (filtering.parse_filters) в запрос Elasticsearch.
+
+    Поиск q идет по названию и описанию анализатором ru_en из маппинга ETL,
+    персона ищется фразой в именах всех ролей.
+    """
+    must = []
+    conditions = []
+    if filters['genres']:
+        conditions.append({'terms': {'genres': filters['genres']}})
+    if filters['persons']:
+        # Точное совпадение имени, как person__full_name__in в Postgres
+        conditions.append({
+            'bool': {
+                'should': [
+                    {'terms': {f'{role}_names.raw': filters['persons']}}
+                    for role in ROLES
+                ],
+                'minimum_should_match': 1,
+            }
+        })
+    if filters['type'] is not None:
+        conditions.append({'term': {'type': filters['type']}})
+    rating = {
+        bound: filters[name]
+        for bound, name in (('gte', 'rating_min'), ('lte', 'rating_max'))
+        if filters[name] is not None
+    }
+    if rating:
+        conditions.append({'range': {'imdb_rating': rating}})
+    creation_date = {
+        bound: filters[name].isoformat()
+        for bound, name in (('gte', 'date_from'), ('lte', 'date_to'))
+        if filters[name] is not None
+    }
+    if creation_date:
+        conditions.append({'range': {'creation_date': creation_date}})
+    if filters['q'] is not None:
+        must.append({'multi_match': {'query': filters['q'], 'fields': ['title^3', 'description']}})
+    if not must and not conditions:
+        return {'match_all': {}}
+    return {'bool': {'must': must, 'filter': conditions}}
+
+
+class MovieSearchResults:
+    """Фильмы из индекса в виде последовательности для Paginator.
+
+    Paginator вызывает count() и берет срез страницы: это два запроса
+    к Elasticsearch (_count и _search с from/size) вместо COUNT(*)
+    и GROUP BY по четырем соединениям в Postgres.
+    """
+
+    def __init__(self, filters):
+        self.client = get_client()
+        self.index = settings.ELASTICSEARCH['INDEX']
+        self.query = build_query(filters)
+        self.sort = build_sort(filters['sort'])
+
+    def count(self):
+        return self.client.count(index=self.index, query=self.query)['count']
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        response = self.client.search(
+            index=self.index,
+            query=self.query,
+            from_=start,
+            size=max(item.stop - start, 0),
+            sort=self.sort,
+            track_total_hits=False,
+        )
+        return [to_movie(hit['_source']) for hit in response['hits']['hits']]
+
+
+def get_movie(pk):
+    """Фильм по id или None, если в индексе его нет."""
+    try:
+        response = get_client().get(index=settings.ELASTICSEARCH['INDEX'], id=str(pk))
+    except NotFoundError:
+        return None
+    return to_movie(response['_source'])
+
+
+def search_after(position, size, filters):
+    """Страница фильмов после позиции (creation_date, id) курсора.
+
+    Курсор есть только у сортировки по умолчанию (-creation_date).
+    """
+    params = {}
+    if position is not None:
+        creation_date, movie_id = position
+        if creation_date is None:
+            sort_date = MISSING_DATE
+        else:
+            # Даты в сортировке Elasticsearch - миллисекунды от начала эпохи (UTC)
+            midnight = datetime.datetime.combine(
+                creation_date, datetime.time(), tzinfo=datetime.timezone.utc
+            )
+            sort_date = int(midnight.timestamp()) * 1000
+        params['search_after'] = [sort_date, str(movie_id)]
+    response = get_client().search(
+        index=settings.ELASTICSEARCH['INDEX'],
+        query=build_query(filters),
+        size=size,
+        sort=build_sort(filters['sort']),
+        track_total_hits=False,
+        **params,
+    )
+    return [to_movie(hit['_source']) for hit in response['hits']['hits']]
+
+
+def count(filters):
+    """Число фильмов в индексе, подходящих под фильтры."""
+    return get_client().count(
+        index=settings.ELASTICSEARCH['INDEX'], query=build_query(filters)
+    )['count']
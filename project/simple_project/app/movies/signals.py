@@ -0,0 +1,69 @@
+"""Сброс кеша ответов API при изменении данных фильмов.
+
+Кеш сбрасывается после коммита транзакции, чтобы параллельный запрос
+не успел закешировать данные, которые еще не видны в базе.
+Изменения в обход ORM (queryset.update, bulk_create, SQL) сигналов
+не вызывают: кеш для них сбросится только по таймауту.
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from movies.api.v1.cache import invalidate
+from movies.models import FilmWork, Genre, GenreFilmWork, Person, PersonFilmWork
+
+
+def invalidate_on_commit(film_ids, count=False):
+    film_ids = list(film_ids)
+    transaction.on_commit(lambda: invalidate(film_ids, count=count))
+
+
+@receiver(post_save, sender=FilmWork)
+def film_work_saved(sender, instance, created, **kwargs):
+    invalidate_on_commit([instance.pk], count=created)
+
+
+@receiver(post_delete, sender=FilmWork)
+def film_work_deleted(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk], count=True)
+
+
+@receiver(post_save, sender=Person)
+def person_changed(sender, instance, **kwargs):
+    invalidate_on_commit(
+        PersonFilmWork.objects.filter(person=instance).values_list('film_work_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Genre)
+def genre_changed(sender, instance, **kwargs):
+    invalidate_on_commit(
+        GenreFilmWork.objects.filter(genre=instance).values_list('film_work_id', flat=True)
+    )
+
+
+# Удаление персоны или жанра каскадно удаляет их связи с фильмами,
+# и фильмы сбрасываются сигналами связующих таблиц
+@receiver(post_save, sender=PersonFilmWork)
+@receiver(post_delete, sender=PersonFilmWork)
+@receiver(post_save, sender=GenreFilmWork)
+@receiver(post_delete, sender=GenreFilmWork)
+def film_link_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.film_work_id])
+
+
+@receiver(m2m_changed, sender=FilmWork.persons.through)
+@receiver(m2m_changed, sender=FilmWork.genres.through)
+def film_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Связи, измененные через add/remove/clear, минуя сохранение моделей."""
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_on_commit([instance.pk])
+    elif action == 'pre_clear':
+        # После clear() со стороны персоны или жанра фильмы уже не найти
+        field = 'person' if sender is FilmWork.persons.through else 'genre'
+        invalidate_on_commit(
+            sender.objects.filter(**{field: instance}).values_list('film_work_id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        invalidate_on_commit(pk_set)